@@ -0,0 +1,143 @@
+"""
+Batched, tensor-side version of the config pair pipeline
+(dataset.transform_pair: photometric_transform, pair_transform, normalize).
+
+The DataLoader workers only decode and resize (datasets built with
+raw=True return uint8 (H, W, 3) pairs); BatchAugment then flips, jitters
+and normalizes whole collated batches with vectorized torch ops on the
+training device:
+
+    augment = BatchAugment()
+    for x, y in loader:
+        x, y = augment(x.to(config.DEVICE), y.to(config.DEVICE))
+
+Every random draw is per sample, as in albumentations: HorizontalFlip
+with flip_p, and ColorJitter with jitter_p, its four factors and a random
+order of brightness / contrast / saturation / hue, rounding to uint8
+after each step. The flip is shared by the input and its target, so a
+pair never ends up mirrored against itself; each one is jittered only
+if configured (config.JITTER_INPUT / JITTER_TARGET).
+"""
+import torch
+
+# ITU-R 601 luma, as cv2.COLOR_RGB2GRAY
+GRAY_WEIGHTS = (0.299, 0.587, 0.114)
+
+
+def _gray(img):
+    r, g, b = img.unbind(1)
+    return (GRAY_WEIGHTS[0] * r + GRAY_WEIGHTS[1] * g + GRAY_WEIGHTS[2] * b).unsqueeze(1)
+
+
+def _per_sample(factor):
+    return factor.view(-1, 1, 1, 1)
+
+
+def adjust_brightness(img, factor):
+    return img * _per_sample(factor)
+
+
+def adjust_contrast(img, factor):
+    mean = _gray(img).mean(dim=(1, 2, 3), keepdim=True)
+    factor = _per_sample(factor)
+    return img * factor + mean * (1 - factor)
+
+
+def adjust_saturation(img, factor):
+    factor = _per_sample(factor)
+    return img * factor + _gray(img) * (1 - factor)
+
+
+def adjust_hue(img, factor):
+    """Rotate the hue of 0..255 RGB images by factor (in turns, -0.5..0.5)."""
+    h, s, v = _rgb_to_hsv(img / 255)
+    h = (h + _per_sample(factor).squeeze(1)) % 1.0
+    return _hsv_to_rgb(h, s, v) * 255
+
+
+def _rgb_to_hsv(img):
+    r, g, b = img.unbind(1)
+    maxc, _ = img.max(dim=1)
+    minc, _ = img.min(dim=1)
+    delta = maxc - minc
+    safe = torch.where(delta > 0, delta, torch.ones_like(delta))
+
+    h = torch.where(
+        maxc == r, (g - b) / safe,
+        torch.where(maxc == g, 2.0 + (b - r) / safe, 4.0 + (r - g) / safe),
+    )
+    h = torch.where(delta > 0, (h / 6.0) % 1.0, torch.zeros_like(h))
+    s = torch.where(maxc > 0, delta / torch.where(maxc > 0, maxc, torch.ones_like(maxc)), torch.zeros_like(maxc))
+    return h, s, maxc
+
+
+def _hsv_to_rgb(h, s, v):
+    # f(n) = v - v * s * clamp(min(k, 4 - k), 0, 1), k = (n + 6h) mod 6, for n = 5, 3, 1
+    h6 = h * 6.0
+    vs = v * s
+    channels = []
+    for n in (5.0, 3.0, 1.0):
+        k = (h6 + n) % 6.0
+        channels.append(v - vs * torch.minimum(k, 4.0 - k).clamp_(0, 1))
+    return torch.stack(channels, dim=1)
+
+
+COLOR_OPS = [adjust_brightness, adjust_contrast, adjust_saturation, adjust_hue]
+
+
+class BatchAugment:
+    """
+    uint8 (B, H, W, 3) input / target batches → augmented, normalized
+    float (B, 3, H, W) in [-1, 1]. Input and target are jittered
+    independently, each only if jitter_input / jitter_target.
+    """
+    def __init__(self, flip_p=0.5, jitter_p=0.2, jitter_input=True, jitter_target=False,
+                 brightness=(0.8, 1.2), contrast=(0.8, 1.2), saturation=(0.8, 1.2), hue=(-0.5, 0.5),
+                 generator=None):
+        self.flip_p = flip_p
+        self.jitter_p = jitter_p
+        self.jitter_input = jitter_input
+        self.jitter_target = jitter_target
+        self.ranges = [brightness, contrast, saturation, hue]
+        self.generator = generator
+
+    def _rand(self, *shape, device):
+        return torch.rand(*shape, device=device, generator=self.generator)
+
+    def __call__(self, x, y):
+        x = x.permute(0, 3, 1, 2).float()
+        y = y.permute(0, 3, 1, 2).float()
+
+        flip = (self._rand(x.size(0), device=x.device) < self.flip_p).nonzero().squeeze(1)
+        x[flip] = x[flip].flip(-1)
+        y[flip] = y[flip].flip(-1)
+
+        if self.jitter_input:
+            x = self.color_jitter(x)
+        if self.jitter_target:
+            y = self.color_jitter(y)
+
+        return normalize(x), normalize(y)
+
+    def color_jitter(self, img):
+        b = img.size(0)
+        apply = self._rand(b, device=img.device) < self.jitter_p
+        if not apply.any():
+            return img
+
+        factors = [lo + (hi - lo) * self._rand(b, device=img.device) for lo, hi in self.ranges]
+        order = self._rand(b, len(COLOR_OPS), device=img.device).argsort(dim=1)
+
+        img = img.clone()
+        for step in range(len(COLOR_OPS)):
+            for op, fn in enumerate(COLOR_OPS):
+                selected = (apply & (order[:, step] == op)).nonzero().squeeze(1)
+                if selected.numel():
+                    out = fn(img[selected], factors[op][selected])
+                    img[selected] = out.clamp_(0, 255).round_()
+        return img
+
+
+def normalize(img):
+    """In place, 0..255 → [-1, 1], bit-identical to A.Normalize(mean=0.5, std=0.5, max_pixel_value=255)"""
+    return img.sub_(127.5).mul_(1 / 127.5)
@@ -0,0 +1,112 @@
+"""
+Fixed vs adaptive best-of-N on validation data (same setup as test2.py).
+
+The score threshold is learned from the first CALIBRATION_IMAGES: it is the
+THRESHOLD_QUANTILE of the best-of-N discriminator scores there. The
+remaining images are then run both ways, reporting latency, samples used,
+L1 against the ground truth and the discriminator score of the pick. The
+printed threshold can be used as SCORE_THRESHOLD when serving.
+
+Candidates are drawn the way the server draws them with
+STOCHASTIC_DROPOUT=1: from the backend Generator, with its dropout on.
+(Train's Generator has no dropout, so in eval mode every candidate would
+be the same image.)
+"""
+import time
+import torch
+from torch.utils.data import DataLoader
+from discriminator import Discriminator
+from dataset import ImageDataset
+from utils import load_serving_generator, load_weights
+import serving_path  # noqa: F401
+# Sampling code shared with the server
+from apiUtils import adaptive_best_of_n, best_of_n
+from engine import set_dropout
+
+# -------------------------------
+# Config
+# -------------------------------
+VAL_DIR = "SceneDataset/newVal"
+CHECKPOINT_GEN = "SceneGenNew.pth.tar"
+CHECKPOINT_DISC = "SceneDiscNew.pth.tar"
+NUM_SAMPLES = 5           # fixed N, and the cap for adaptive sampling
+MAX_IMAGES = 120          # limit validation to this many images
+CALIBRATION_IMAGES = 20   # images used to learn the threshold
+THRESHOLD_QUANTILE = 0.5
+MIN_SCORE_GAIN = 0.01
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def _sync():
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+
+
+def disc_score(disc, x, fake):
+    with torch.no_grad():
+        return disc(x, fake).mean().item()
+
+
+def learn_threshold(gen, disc, batches):
+    """THRESHOLD_QUANTILE of the fixed best-of-N scores on the calibration images."""
+    scores = torch.tensor([disc_score(disc, x, best_of_n(x, gen, disc, NUM_SAMPLES)) for x, _ in batches])
+    return torch.quantile(scores, THRESHOLD_QUANTILE).item()
+
+
+def evaluate(gen, disc, batches, sample):
+    """Average latency, samples used, L1 and discriminator score for one sampling policy."""
+    totals = {"ms": 0.0, "samples": 0.0, "l1": 0.0, "score": 0.0}
+
+    for x, y in batches:
+        _sync()
+        start = time.perf_counter()
+        fake, used = sample(x)
+        _sync()
+        totals["ms"] += (time.perf_counter() - start) * 1000
+        totals["samples"] += used
+        totals["l1"] += torch.nn.functional.l1_loss(fake, y).item()
+        totals["score"] += disc_score(disc, x, fake)
+
+    return {k: v / len(batches) for k, v in totals.items()}
+
+
+def main():
+    gen = set_dropout(load_serving_generator(CHECKPOINT_GEN, device), True)
+    disc = Discriminator(in_channels=3).to(device)
+    disc.load_state_dict(load_weights(CHECKPOINT_DISC, device))
+    disc.eval()
+
+    val_loader = DataLoader(ImageDataset(root_dir=VAL_DIR), batch_size=1, shuffle=False)
+    batches = []
+    for i, (x, y) in enumerate(val_loader):
+        if i >= MAX_IMAGES:
+            break
+        batches.append((x.to(device), y.to(device)))
+
+    calibration, evaluation = batches[:CALIBRATION_IMAGES], batches[CALIBRATION_IMAGES:]
+    threshold = learn_threshold(gen, disc, calibration)
+    print(f"Learned threshold (q={THRESHOLD_QUANTILE}) on {len(calibration)} images: {threshold:.4f}")
+
+    def fixed(x):
+        return best_of_n(x, gen, disc, NUM_SAMPLES), NUM_SAMPLES
+
+    def adaptive(x):
+        fake, used, _ = adaptive_best_of_n(x, gen, disc, NUM_SAMPLES, threshold, MIN_SCORE_GAIN)
+        return fake, used.item()
+
+    results = {name: evaluate(gen, disc, evaluation, sample) for name, sample in [("fixed", fixed), ("adaptive", adaptive)]}
+
+    print(f"\n{len(evaluation)} validation images")
+    for name, r in results.items():
+        print(
+            f"{name:>8}: {r['ms']:7.1f} ms/image | {r['samples']:.2f} samples | "
+            f"L1 {r['l1']:.4f} | disc score {r['score']:.4f}"
+        )
+    saved = 1 - results["adaptive"]["ms"] / results["fixed"]["ms"]
+    print(f"\nLatency saved: {saved:.1%} | L1 change: {results['adaptive']['l1'] - results['fixed']['l1']:+.4f}")
+    print(f"Serve with SCORE_THRESHOLD={threshold:.4f} MIN_SCORE_GAIN={MIN_SCORE_GAIN}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Samples/sec of the training data pipeline: the previous per-image
+albumentations pipelines (transform_only_input on the input and, by
+mistake, on the target too) against dataset.transform_pair, which
+augments the stacked 6-channel pair once. Optionally also the packed
+dataset (--packed, from pack_dataset.py) and raw batches through
+augment.BatchAugment on config.DEVICE.
+
+Usage:
+    python bench_dataset.py CombinedDataset/train [--packed packed/train.json] [--samples 256]
+Without a directory, --samples synthetic 256x512 pairs are generated.
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import torch
+from PIL import Image
+import config
+from augment import BatchAugment
+from dataset import ImageDataset, PackedImageDataset
+
+
+def legacy_getitem(dataset, index):
+    """The pre-change ImageDataset.__getitem__, kept here only for comparison."""
+    img_path = os.path.join(dataset.root_dir, dataset.list_files[index])
+    image = np.array(Image.open(img_path))
+    input_image = image[:, :256, :]
+    target_image = image[:, 256:, :]
+
+    augementations = config.both_transform(image=input_image, image0=target_image)
+    input_image, target_image = augementations["image"], augementations["image0"]
+
+    input_image = config.transform_only_input(image=input_image)["image"]
+    target_image = config.transform_only_input(image=target_image)["image"]
+    return input_image, target_image
+
+
+def synthetic_pairs(root_dir, count):
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        sketch = np.full((256, 256, 3), 255, np.uint8)
+        sketch[rng.integers(0, 256, 2000), rng.integers(0, 256, 2000)] = 0
+        target = rng.integers(0, 256, (256, 256, 3), dtype=np.uint8)
+        Image.fromarray(np.concatenate([sketch, target], axis=1)).save(os.path.join(root_dir, f"{i:05d}.png"))
+
+
+def samples_per_second(getitem, count):
+    getitem(0)  # warmup
+    start = time.perf_counter()
+    for i in range(count):
+        getitem(i)
+    return count / (time.perf_counter() - start)
+
+
+def batched_samples_per_second(dataset, count, batch_size):
+    augment = BatchAugment(jitter_input=config.JITTER_INPUT, jitter_target=config.JITTER_TARGET)
+    start = time.perf_counter()
+    for first in range(0, count, batch_size):
+        items = [dataset[i] for i in range(first, min(first + batch_size, count))]
+        x = torch.stack([x for x, _ in items]).to(config.DEVICE)
+        y = torch.stack([y for _, y in items]).to(config.DEVICE)
+        x, y = augment(x, y)
+    if x.is_cuda:
+        torch.cuda.synchronize()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root_dir", nargs="?", help="directory of side-by-side pair images")
+    parser.add_argument("--packed", help="index JSON of the same pairs, from pack_dataset.py")
+    parser.add_argument("--samples", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=config.BATCH_SIZE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        root_dir = args.root_dir
+        if root_dir is None:
+            root_dir = workdir
+            synthetic_pairs(root_dir, args.samples)
+
+        dataset = ImageDataset(root_dir)
+        packed = PackedImageDataset(args.packed) if args.packed else None
+        count = min(args.samples, len(dataset), len(packed) if packed else len(dataset))
+
+        results = [
+            ("previous pipeline", samples_per_second(lambda i: legacy_getitem(dataset, i), count)),
+            ("pair pipeline", samples_per_second(dataset.__getitem__, count)),
+        ]
+        if packed:
+            results.append(("packed + pair pipeline", samples_per_second(packed.__getitem__, count)))
+            raw = PackedImageDataset(args.packed, raw=True)
+        else:
+            raw = ImageDataset(root_dir, raw=True)
+        results.append((
+            f"raw + BatchAugment ({config.DEVICE})",
+            batched_samples_per_second(raw, count, args.batch_size),
+        ))
+
+    baseline = results[0][1]
+    print(f"{count} samples, one process")
+    for name, rate in results:
+        print(f"{name:<32}{rate:>10.1f} samples/s  {rate / baseline:>5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
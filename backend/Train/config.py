@@ -5,10 +5,31 @@ from albumentations.pytorch import ToTensorV2
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 TRAIN_DIR = "CombinedDataset/train"
 VAL_DIR = "CombinedDataset/val"
+# Index files from pack_dataset.py; when set, used instead of the directories
+TRAIN_PACKED = None
+VAL_PACKED = None
 GEN_LEARNING_RATE = 2e-4
 DISC_LEARNING_RATE = 1e-4
 BATCH_SIZE = 16
 NUM_WORKERS = 4
+VAL_BATCH_SIZE = 6
+VAL_NUM_WORKERS = 0  # only the first validation batch is ever loaded
+# DataLoader settings used by loader.py
+PIN_MEMORY = DEVICE == "cuda"
+PERSISTENT_WORKERS = True
+PREFETCH_FACTOR = 4  # batches loaded ahead by each worker
+# Per-iteration timings (data wait, D step, both G steps, LPIPS), samples/s
+# and peak memory as JSONL (instrument.py); None = off. Synchronizes the
+# device once per iteration.
+STEP_LOG = "train_steps.jsonl"
+# torch.profiler Chrome trace of iterations PROFILE_ITERS = [start, stop) of
+# epoch PROFILE_EPOCH (1-based) into PROFILE_DIR; None = off
+PROFILE_EPOCH = None
+PROFILE_ITERS = (20, 25)
+PROFILE_DIR = "profiles"
+# Per-block time / FLOPs / activation memory of both models at BATCH_SIZE,
+# printed and traced into PROFILE_DIR before training starts
+LAYER_PROFILE = False
 IMAGE_SIZE = 256
 CHANNELS_IMG = 3
 L1_LAMBDA = 10
@@ -19,10 +40,28 @@ SAVE_MODEL = True
 CHECKPOINT_DISC = "models/disc471.pth.tar"
 CHECKPOINT_GEN = "gen_transfered.pth"
 
+# Flip / jitter / normalize whole training batches on DEVICE with
+# augment.BatchAugment instead of pair_transform & co. in the workers.
+# Meant for a CUDA DEVICE; on CPU the OpenCV ops in the workers are faster.
+GPU_AUGMENT = False
+
+# Photometric jitter (photometric_transform) on the input sketch and/or the
+# target. Off for the target: the generator should learn the real colors.
+JITTER_INPUT = True
+JITTER_TARGET = False
+
 both_transform = A.Compose(
     [A.Resize(width=256, height=256),], additional_targets={"image0": "image"},
 )
 
+# Pair pipeline (dataset.transform_pair): photometric jitter where
+# configured, then the geometric augmentation once on the input and target
+# stacked as one 6-channel image, so both always get the same flip
+photometric_transform = A.Compose([A.ColorJitter(p=0.2),])
+
+pair_transform = A.Compose([A.HorizontalFlip(p=0.5),])
+
+# Previous per-image pipelines, kept for Train/bench_dataset.py
 transform_only_input = A.Compose(
     [
         A.HorizontalFlip(p=0.5),
@@ -1,12 +1,17 @@
 from PIL import Image
+import bisect
+import cv2
+import json
 import numpy as np
 import os
+import torch
 import config
 from torch.utils.data import Dataset
 
 class ImageDataset(Dataset):
-    def __init__(self,root_dir):
+    def __init__(self,root_dir, raw=False):
         self.root_dir = root_dir
+        self.raw = raw
         self.list_files = os.listdir(self.root_dir)
         # print(self.list_files)
     
@@ -23,7 +28,73 @@ class ImageDataset(Dataset):
         augementations = config.both_transform(image= input_image, image0= target_image)
         input_image,target_image = augementations["image"],augementations["image0"]
 
-        input_image = config.transform_only_input(image= input_image)["image"]
-        target_image = config.transform_only_input(image = target_image)["image"]
+        return transform_pair(input_image, target_image, self.raw)
 
-        return input_image, target_image
\ No newline at end of file
+
+def transform_pair(input_image, target_image, raw=False):
+    """
+    Augment and normalize an (H, W, 3) uint8 input / target pair with the
+    config pair pipeline: (3, H, W) float tensors in [-1, 1]. With raw=True
+    the images come back as they are, as uint8 tensors, for
+    augment.BatchAugment to process whole batches on the training device.
+    """
+    if raw:
+        return torch.from_numpy(np.array(input_image)), torch.from_numpy(np.array(target_image))
+
+    # Color jitter is per pixel (plus the global mean for contrast), so it
+    # commutes with the geometric part and runs on the separate images
+    if config.JITTER_INPUT:
+        input_image = config.photometric_transform(image=input_image)["image"]
+    if config.JITTER_TARGET:
+        target_image = config.photometric_transform(image=target_image)["image"]
+
+    pair = cv2.merge([*cv2.split(input_image), *cv2.split(target_image)])
+    pair = config.pair_transform(image=pair)["image"]
+
+    # Same as A.Normalize(mean=0.5, std=0.5, max_pixel_value=255), on all 6 channels at once
+    pair = torch.from_numpy(np.ascontiguousarray(pair)).permute(2, 0, 1).contiguous()
+    pair = pair.float().sub_(127.5).mul_(1 / 127.5)
+    return pair[:3], pair[3:]
+
+
+class PackedImageDataset(Dataset):
+    """
+    Pairs packed by pack_dataset.py: already decoded and resized, so a
+    sample is a zero-copy slice of a memory-mapped (N, 2, H, W, 3) uint8
+    shard. The shards are opened lazily in each DataLoader worker, which
+    then all read the same pages from the OS cache.
+    """
+    def __init__(self, index_path, raw=False):
+        self.raw = raw
+        with open(index_path) as f:
+            self.index = json.load(f)
+        self.root_dir = os.path.dirname(os.path.abspath(index_path))
+        self.list_files = self.index["files"]
+        self.offsets = np.cumsum([0] + [shard["count"] for shard in self.index["shards"]]).tolist()
+        self._shards = None
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    def __getstate__(self):
+        # Workers map the shards themselves instead of receiving a copy
+        state = self.__dict__.copy()
+        state["_shards"] = None
+        return state
+
+    def shards(self):
+        if self._shards is None:
+            self._shards = [
+                np.load(os.path.join(self.root_dir, shard["file"]), mmap_mode="r")
+                for shard in self.index["shards"]
+            ]
+        return self._shards
+
+    def pair(self, index):
+        """The raw (2, H, W, 3) uint8 view of sample index: input, target."""
+        shard = bisect.bisect_right(self.offsets, index) - 1
+        return self.shards()[shard][index - self.offsets[shard]]
+
+    def __getitem__(self, index):
+        pair = self.pair(index)
+        return transform_pair(pair[0], pair[1], self.raw)
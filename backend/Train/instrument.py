@@ -0,0 +1,208 @@
+"""
+Per-iteration instrumentation of the training step.
+
+StepTimer times the named stages of one iteration (data wait,
+discriminator step, each generator step, LPIPS forward) with CUDA events
+on the GPU, so the stages are not synchronized one by one; the iteration
+is synchronized once when its times are read. StepLog writes one JSON
+line per iteration plus an epoch summary:
+
+    {"epoch": 3, "iter": 120, "batch_size": 16, "data_ms": 1.2, "disc_ms": 48.0,
+     "gen_step_1_ms": 95.1, "gen_step_2_ms": 94.8, "lpips_ms": 61.3, "step_ms": 240.2,
+     "samples_per_s": 66.6, "peak_mem_mb": 5120.4}
+
+The lpips span runs inside gen_step_1 / gen_step_2, so lpips_ms is part
+of their times already; step_ms is the sum of the other, top-level
+stages (NESTED_STAGES are left out of it).
+
+ProfilerWindow runs torch.profiler over a chosen range of iterations and
+writes a Chrome trace, with the same stage names as record_function
+labels. profile_layers breaks the forward passes of both models down per
+block with the server's profiling.LayerProfiler.
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+import torch
+from torch.profiler import ProfilerActivity, profile, record_function
+import serving_path  # noqa: F401
+from metrics import peak_rss_mb
+from profiling import profile_pair
+
+# Stages timed inside another stage, not added to step_ms
+NESTED_STAGES = ("lpips",)
+
+
+def peak_memory_mb(device):
+    """Peak allocated CUDA memory since the last reset, or the peak RSS of the process on CPU."""
+    device = torch.device(device)
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated(device) / 2**20
+    return peak_rss_mb()
+
+
+class StepTimer:
+    """
+    Stage times of one iteration, in ms. Repeated stages (lpips) add up.
+    Disabled, spans are only record_function labels for the profiler.
+    """
+    def __init__(self, device, enabled=True):
+        self.cuda = torch.device(device).type == "cuda"
+        self.enabled = enabled
+        self._spans = []
+        self._extra = {}
+
+    @contextmanager
+    def span(self, name):
+        with record_function(name):
+            if not self.enabled:
+                yield
+            elif self.cuda:
+                start, end = torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)
+                start.record()
+                yield
+                end.record()
+                self._spans.append((name, start, end))
+            else:
+                start = time.perf_counter()
+                yield
+                self._extra[name] = self._extra.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def add(self, name, ms):
+        if self.enabled:
+            self._extra[name] = self._extra.get(name, 0.0) + ms
+
+    def times(self):
+        if self.cuda and self._spans:
+            self._spans[-1][2].synchronize()
+        times = dict(self._extra)
+        for name, start, end in self._spans:
+            times[name] = times.get(name, 0.0) + start.elapsed_time(end)
+        self._spans.clear()
+        self._extra = {}
+        return times
+
+
+class StepLog:
+    """JSONL log of iteration records and per-epoch summaries; path None = off."""
+    def __init__(self, path, device):
+        self.path = path
+        self.device = device
+        self._file = open(path, "a") if path else None
+        self._records = []
+
+    @property
+    def enabled(self):
+        return self._file is not None
+
+    def start_epoch(self):
+        self._records = []
+        self._epoch_start = time.perf_counter()
+        if torch.device(self.device).type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+
+    def step(self, epoch, iteration, batch_size, times):
+        step_ms = sum(ms for name, ms in times.items() if name not in NESTED_STAGES)
+        record = {
+            "epoch": epoch,
+            "iter": iteration,
+            "batch_size": batch_size,
+            **{f"{name}_ms": round(ms, 3) for name, ms in times.items()},
+            "step_ms": round(step_ms, 3),
+            "samples_per_s": round(batch_size / step_ms * 1000, 2) if step_ms else None,
+            "peak_mem_mb": peak_memory_mb(self.device),
+        }
+        self._records.append(record)
+        self._write(record)
+
+    def end_epoch(self, epoch, extra=None):
+        """Write the epoch summary (mean stage times, overall samples/s) and return it."""
+        if not self._records:
+            return None
+        seconds = time.perf_counter() - self._epoch_start
+        keys = [k for k in self._records[0] if k.endswith("_ms")]
+        summary = {
+            "epoch": epoch,
+            "summary": True,
+            "iterations": len(self._records),
+            **{f"mean_{k}": round(sum(r.get(k, 0.0) for r in self._records) / len(self._records), 3) for k in keys},
+            "samples_per_s": round(sum(r["batch_size"] for r in self._records) / seconds, 2),
+            "peak_mem_mb": peak_memory_mb(self.device),
+            **(extra or {}),
+        }
+        self._write(summary)
+        return summary
+
+    def _write(self, record):
+        if self._file is not None:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def profile_layers(gen, disc, folder, batch_size=1):
+    """
+    Per-block time / FLOPs / activation memory of gen and disc at
+    batch_size (profiling.profile_pair): printed, and written as Chrome
+    traces to <folder>/layers_gen.json and layers_disc.json. The models
+    run in eval mode, so BatchNorm statistics are left untouched.
+    """
+    modes = gen.training, disc.training
+    gen.eval()
+    disc.eval()
+    try:
+        gen_prof, disc_prof = profile_pair(gen, disc, batch_size)
+    finally:
+        gen.train(modes[0])
+        disc.train(modes[1])
+
+    print(gen_prof.table())
+    print(disc_prof.table())
+    os.makedirs(folder, exist_ok=True)
+    for prof, name in [(gen_prof, "gen"), (disc_prof, "disc")]:
+        path = os.path.join(folder, f"layers_{name}.json")
+        prof.chrome_trace(path)
+        print(f"=> Wrote layer trace {path}")
+
+
+class ProfilerWindow:
+    """
+    torch.profiler over iterations [start, stop) of one epoch (None =
+    never), written to <folder>/epoch<epoch>_iters<start>-<stop>.json.
+    Call step(epoch, iteration) at the top of each iteration and close()
+    after the loop.
+    """
+    def __init__(self, epoch, start, stop, folder, device):
+        self.epoch = epoch
+        self.start = start
+        self.stop = stop
+        self.folder = folder
+        self.activities = [ProfilerActivity.CPU]
+        if torch.device(device).type == "cuda":
+            self.activities.append(ProfilerActivity.CUDA)
+        self._prof = None
+
+    def step(self, epoch, iteration):
+        if epoch != self.epoch:
+            return
+        if iteration == self.start:
+            self._prof = profile(activities=self.activities, record_shapes=True, profile_memory=True)
+            self._prof.start()
+        elif iteration == self.stop:
+            self.close()
+
+    def close(self):
+        if self._prof is None:
+            return
+        self._prof.stop()
+        os.makedirs(self.folder, exist_ok=True)
+        path = os.path.join(self.folder, f"epoch{self.epoch}_iters{self.start}-{self.stop}.json")
+        self._prof.export_chrome_trace(path)
+        print(self._prof.key_averages().table(sort_by="self_cpu_time_total", row_limit=15))
+        print(f"=> Wrote profiler trace {path}")
+        self._prof = None
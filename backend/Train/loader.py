@@ -0,0 +1,94 @@
+"""
+DataLoader setup for training, driven by config.py.
+
+    train_loader, val_loader = build_loaders(train_dataset, val_dataset)
+    batches = DevicePrefetcher(train_loader, config.DEVICE, transform=augment)
+    for x, y in batches:       # already on DEVICE (and augmented)
+        ...
+    print(batches.stall_seconds)
+
+Workers are persistent, so they are started once rather than every epoch,
+and batches land in pinned memory. DevicePrefetcher copies batch k + 1
+to the GPU on a side stream while batch k is being trained on, and
+measures how long the training loop waited on the workers (the loader
+stall).
+"""
+import time
+import torch
+from torch.utils.data import DataLoader
+import config
+
+
+def make_loader(dataset, batch_size, shuffle, num_workers):
+    """DataLoader with the config pinning / persistence / prefetch settings."""
+    workers = {}
+    if num_workers > 0:
+        workers = {"persistent_workers": config.PERSISTENT_WORKERS, "prefetch_factor": config.PREFETCH_FACTOR}
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=shuffle,
+        num_workers=num_workers,
+        pin_memory=config.PIN_MEMORY,
+        **workers,
+    )
+
+
+def build_loaders(train_dataset, val_dataset):
+    train_loader = make_loader(train_dataset, config.BATCH_SIZE, True, config.NUM_WORKERS)
+    val_loader = make_loader(val_dataset, config.VAL_BATCH_SIZE, False, config.VAL_NUM_WORKERS)
+    return train_loader, val_loader
+
+
+def _to_device(batch, device):
+    return [t.to(device, non_blocking=True) for t in batch]
+
+
+class DevicePrefetcher:
+    """
+    Iterate loader with every batch already on device, passed through
+    transform (e.g. augment.BatchAugment) if given. On CUDA the copy and
+    transform of the next batch run on a side stream, overlapping the
+    current step. stall_seconds is the time of the last pass spent
+    waiting for the workers to produce a batch.
+    """
+    def __init__(self, loader, device, transform=None):
+        self.loader = loader
+        self.device = torch.device(device)
+        self.transform = transform
+        self.stream = torch.cuda.Stream(self.device) if self.device.type == "cuda" else None
+        self.stall_seconds = 0.0
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        self.stall_seconds = 0.0
+        batches = iter(self.loader)
+        upcoming = self._load(batches)
+        while upcoming is not None:
+            if self.stream is not None:
+                torch.cuda.current_stream(self.device).wait_stream(self.stream)
+                for t in upcoming:
+                    # Allocated on the side stream, used on the main one
+                    t.record_stream(torch.cuda.current_stream(self.device))
+            current, upcoming = upcoming, self._load(batches)
+            yield current
+
+    def _load(self, batches):
+        start = time.perf_counter()
+        batch = next(batches, None)
+        self.stall_seconds += time.perf_counter() - start
+        if batch is None:
+            return None
+
+        if self.stream is None:
+            return self._prepare(batch)
+        with torch.cuda.stream(self.stream):
+            return self._prepare(batch)
+
+    def _prepare(self, batch):
+        batch = _to_device(batch, self.device)
+        if self.transform is not None:
+            batch = list(self.transform(*batch))
+        return batch
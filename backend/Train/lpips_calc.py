@@ -3,18 +3,14 @@ import cv2
 import torch
 import lpips
 import numpy as np
+from lpips import LPIPS  # re-exported: train.py builds its perceptual loss as lpips_calc.LPIPS
 
 # -------------------------
 # Folder containing triptych images
 # -------------------------
 FOLDER = "SceneValOutputs"   # YOUR FOLDER NAME
 
-# -------------------------
-# LPIPS model (AlexNet backbone)
-# -------------------------
-loss_fn = lpips.LPIPS(net='alex')  # can also use 'vgg'
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
-loss_fn = loss_fn.to(device)
 
 # -------------------------
 # Helper: convert image to tensor [-1,1]
@@ -28,38 +24,50 @@ def img_to_tensor(img):
 # -------------------------
 # Loop through folder
 # -------------------------
-lpips_scores = []
+def evaluate_folder_lpips(folder, net='alex', verbose=True):
+    """Average LPIPS of generated vs ground truth over a folder of triptychs."""
+    # LPIPS model (AlexNet backbone)
+    loss_fn = lpips.LPIPS(net=net)  # can also use 'vgg'
+    loss_fn = loss_fn.to(device)
+
+    lpips_scores = []
+
+    for filename in sorted(os.listdir(folder)):
+        if not filename.lower().endswith((".png", ".jpg", ".jpeg")):
+            continue
 
-for filename in sorted(os.listdir(FOLDER)):
-    if not filename.lower().endswith((".png", ".jpg", ".jpeg")):
-        continue
+        path = os.path.join(folder, filename)
+        img = cv2.imread(path)
+        if img is None or img.shape[1] != 768:
+            print(f"Skipping {filename}, wrong size")
+            continue
 
-    path = os.path.join(FOLDER, filename)
-    img = cv2.imread(path)
-    if img is None or img.shape[1] != 768:
-        print(f"Skipping {filename}, wrong size")
-        continue
+        # Split triptych: sketch | generated | ground truth
+        gen = img[:, 256:512]
+        gt  = img[:, 512:768]
 
-    # Split triptych: sketch | generated | ground truth
-    gen = img[:, 256:512]
-    gt  = img[:, 512:768]
+        # Convert to tensor
+        gen_tensor = img_to_tensor(gen)
+        gt_tensor  = img_to_tensor(gt)
 
-    # Convert to tensor
-    gen_tensor = img_to_tensor(gen)
-    gt_tensor  = img_to_tensor(gt)
+        # Compute LPIPS
+        with torch.no_grad():
+            dist = loss_fn(gen_tensor, gt_tensor)
+        lpips_scores.append(dist.item())
 
-    # Compute LPIPS
-    with torch.no_grad():
-        dist = loss_fn(gen_tensor, gt_tensor)
-    lpips_scores.append(dist.item())
+        if verbose:
+            print(f"{filename}: LPIPS = {dist.item():.4f}")
 
-    print(f"{filename}: LPIPS = {dist.item():.4f}")
+    if not lpips_scores:
+        return None
+    return sum(lpips_scores)/len(lpips_scores)
 
 # -------------------------
 # Average LPIPS
 # -------------------------
-if lpips_scores:
-    avg_lpips = sum(lpips_scores)/len(lpips_scores)
-    print("\nAverage LPIPS:", avg_lpips)
-else:
-    print("No images processed.")
+if __name__ == "__main__":
+    avg_lpips = evaluate_folder_lpips(FOLDER)
+    if avg_lpips is not None:
+        print("\nAverage LPIPS:", avg_lpips)
+    else:
+        print("No images processed.")
@@ -0,0 +1,88 @@
+"""
+Pack a directory of side-by-side training pairs into memory-mapped shards.
+
+Every PNG (input on the left 256 columns, target on the right, as read by
+ImageDataset) is decoded and resized once, here, instead of on every
+epoch. The pairs go into .npy shards of up to --shard-size samples, each
+a (count, 2, size, size, 3) uint8 array, and an index JSON lists the
+shards and the source file of every sample. PackedImageDataset reads it:
+
+    train_dataset = PackedImageDataset("packed/train.json")
+
+or set TRAIN_PACKED / VAL_PACKED in config.py for train.py.
+
+Usage:
+    python pack_dataset.py CombinedDataset/train packed/train.json
+    python pack_dataset.py CombinedDataset/val packed/val.json --shard-size 2000
+"""
+import argparse
+import functools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+import config
+
+
+def load_pair(path, size=config.IMAGE_SIZE):
+    """
+    (2, size, size, 3) uint8: input and target halves, resized like
+    config.both_transform (A.Resize: bilinear) but to size.
+    """
+    image = np.array(Image.open(path).convert("RGB"))
+    halves = image[:, :256, :], image[:, 256:, :]
+    return np.stack([cv2.resize(half, (size, size), interpolation=cv2.INTER_LINEAR) for half in halves])
+
+
+def pack(root_dir, index_path, shard_size=10000, workers=8, size=config.IMAGE_SIZE):
+    files = sorted(os.listdir(root_dir))
+    out_dir = os.path.dirname(os.path.abspath(index_path))
+    stem = os.path.splitext(os.path.basename(index_path))[0]
+    os.makedirs(out_dir, exist_ok=True)
+
+    shards = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for number, start in enumerate(range(0, len(files), shard_size)):
+            names = files[start:start + shard_size]
+            name = f"{stem}.{number:03d}.npy"
+            path = os.path.join(out_dir, name)
+
+            # Written in place through a memmap, so a shard never sits in memory twice
+            tmp = path + ".tmp"
+            shard = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.uint8, shape=(len(names), 2, size, size, 3))
+            paths = [os.path.join(root_dir, f) for f in names]
+            for i, pair in enumerate(tqdm(pool.map(functools.partial(load_pair, size=size), paths), total=len(paths), desc=name)):
+                shard[i] = pair
+            shard.flush()
+            del shard
+            os.replace(tmp, path)
+            shards.append({"file": name, "count": len(names)})
+
+    # Written last: an index only ever points at complete shards
+    index = {"source": os.path.abspath(root_dir), "size": size, "shards": shards, "files": files}
+    with open(index_path, "w") as f:
+        json.dump(index, f)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root_dir", help="directory of side-by-side pair images")
+    parser.add_argument("index", help="index JSON to write; shards go next to it")
+    parser.add_argument("--shard-size", type=int, default=10000, help="samples per shard")
+    parser.add_argument("--workers", type=int, default=8, help="decoding threads")
+    parser.add_argument("--size", type=int, default=config.IMAGE_SIZE, help="side the pairs are resized to")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = pack(args.root_dir, args.index, args.shard_size, args.workers, args.size)
+    total = sum(shard["count"] for shard in index["shards"])
+    print(f"=> Packed {total} pairs into {len(index['shards'])} shards in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
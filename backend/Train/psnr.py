@@ -15,39 +15,49 @@ def psnr(img1, img2):
     PIXEL_MAX = 255.0
     return 20 * log10(PIXEL_MAX / sqrt(mse))
 
-psnr_scores = []
+def evaluate_folder_psnr(folder, verbose=True):
+    """Average PSNR (dB) of generated vs ground truth over a folder of triptychs."""
+    psnr_scores = []
 
-for filename in os.listdir(FOLDER):
-    if not filename.lower().endswith((".png", ".jpg", ".jpeg")):
-        continue
+    for filename in sorted(os.listdir(folder)):
+        if not filename.lower().endswith((".png", ".jpg", ".jpeg")):
+            continue
 
-    path = os.path.join(FOLDER, filename)
+        path = os.path.join(folder, filename)
 
-    # Read full triptych image (sketch | generated | gt)
-    img = cv2.imread(path)
+        # Read full triptych image (sketch | generated | gt)
+        img = cv2.imread(path)
 
-    # Ensure proper shape
-    if img is None or img.shape[1] != 768:
-        print(f"Skipping {filename}, incorrect dimensions")
-        continue
+        # Ensure proper shape
+        if img is None or img.shape[1] != 768:
+            print(f"Skipping {filename}, incorrect dimensions")
+            continue
 
-    h, w, _ = img.shape
+        h, w, _ = img.shape
 
-    # Split the 256×768 image into 3 parts of width 256 each
-    sketch = img[:, :256]
-    gen = img[:, 256:512]
-    gt = img[:, 512:]
+        # Split the 256×768 image into 3 parts of width 256 each
+        sketch = img[:, :256]
+        gen = img[:, 256:512]
+        gt = img[:, 512:]
 
-    # Compute PSNR between generated and GT (only)
-    value = psnr(gen.astype(np.float32), gt.astype(np.float32))
-    psnr_scores.append(value)
+        # Compute PSNR between generated and GT (only)
+        value = psnr(gen.astype(np.float32), gt.astype(np.float32))
+        psnr_scores.append(value)
+
+        if verbose:
+            print(f"{filename}: PSNR = {value:.4f} dB")
+
+    if not psnr_scores:
+        return None
+    return sum(psnr_scores) / len(psnr_scores)
 
-    print(f"{filename}: PSNR = {value:.4f} dB")
 
 # -------------------------
 # Final result
 # -------------------------
-if len(psnr_scores) > 0:
-    print("\nAverage PSNR:", sum(psnr_scores) / len(psnr_scores))
-else:
-    print("No images processed.")
+if __name__ == "__main__":
+    avg_psnr = evaluate_folder_psnr(FOLDER)
+    if avg_psnr is not None:
+        print("\nAverage PSNR:", avg_psnr)
+    else:
+        print("No images processed.")
@@ -0,0 +1,185 @@
+"""
+Static post-training int8 quantization (FX graph mode) of a trained
+Generator/Discriminator pair for CPU serving.
+
+Both networks are calibrated on ImageDataset samples, converted to int8,
+scripted and saved next to their checkpoints as <name>.int8.pt, which is
+where the server looks for them when QUANTIZED_MODELS selects the model
+type. The discriminator is calibrated on the int8 generator's outputs,
+which is what it scores when serving. A quality gate then compares int8
+against fp32 on validation data with the PSNR/SSIM/LPIPS scripts, and
+checks that the int8 discriminator picks the same best-of-N candidate as
+the fp32 one; nothing is saved if it fails.
+
+Usage:
+    python quantize.py --gen finalObjectGen.pth --disc finalObjectDisc.pth.tar \
+        --calib-dir CombinedDataset/train --val-dir CombinedDataset/val
+"""
+import argparse
+import copy
+import itertools
+import os
+import tempfile
+import torch
+import torchvision.utils as vutils
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+from torch.utils.data import DataLoader
+from deepGenerator import Generator
+from discriminator import Discriminator
+from dataset import ImageDataset
+from lpips_calc import evaluate_folder_lpips
+from psnr import evaluate_folder_psnr
+from ssim import evaluate_folder_ssim
+from utils import load_serving_generator, load_weights
+import serving_path  # noqa: F401
+# Checkpoint naming and the dropout switch shared with the server
+from checkpoints import derived_path
+from engine import set_dropout
+
+# Quantized kernels are CPU-only
+device = torch.device("cpu")
+
+
+def quantized_path(checkpoint_path):
+    """finalObjectGen.pth / SceneDisc.pth.tar → finalObjectGen.int8.pt / SceneDisc.int8.pt"""
+    return derived_path(checkpoint_path, ".int8.pt")
+
+
+def denorm(img):
+    return (img * 0.5 + 0.5).clamp(0, 1)
+
+
+# -------------------------
+# Quantization
+# -------------------------
+def quantize(model, calibration_inputs, example_inputs):
+    """
+    Insert observers, run the calibration batches through the model and
+    convert it to int8. calibration_inputs yields argument tuples.
+    """
+    engines = torch.backends.quantized.supported_engines
+    torch.backends.quantized.engine = "x86" if "x86" in engines else "fbgemm"
+    qconfig_mapping = get_default_qconfig_mapping(torch.backends.quantized.engine)
+
+    prepared = prepare_fx(copy.deepcopy(model).eval(), qconfig_mapping, example_inputs=example_inputs)
+    with torch.no_grad():
+        for inputs in calibration_inputs:
+            prepared(*inputs)
+    return convert_fx(prepared)
+
+
+def calibrate_pair(gen, disc, loader, num_batches):
+    """
+    Quantize the generator on sketches, then the discriminator on (sketch,
+    int8 fake) pairs: served together, the int8 discriminator only ever
+    scores the int8 generator's outputs.
+    """
+    batches = [x.to(device) for x, _ in itertools.islice(loader, num_batches)]
+    example = (batches[0],)
+
+    q_gen = quantize(gen, [(x,) for x in batches], example)
+
+    with torch.no_grad():
+        disc_inputs = [(x, q_gen(x)) for x in batches]
+    q_disc = quantize(disc, disc_inputs, disc_inputs[0])
+
+    return q_gen, q_disc
+
+
+# -------------------------
+# Quality Gate
+# -------------------------
+def quality_report(gen, q_gen, loader, num_images):
+    """
+    PSNR/SSIM/LPIPS of int8 against fp32 outputs. Triptychs are written as
+    (sketch | int8 | fp32) so the metric scripts score the int8 output
+    against the fp32 one as ground truth.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        with torch.no_grad():
+            for i, (x, _) in enumerate(itertools.islice(loader, num_images)):
+                x = x.to(device)
+                comparison = torch.cat([denorm(x), denorm(q_gen(x)), denorm(gen(x))], dim=3)
+                vutils.save_image(comparison, f"{folder}/{i:04d}.png")
+
+        return {
+            "psnr": evaluate_folder_psnr(folder, verbose=False),
+            "ssim": evaluate_folder_ssim(folder),
+            "lpips": evaluate_folder_lpips(folder, verbose=False),
+        }
+
+
+def ranking_agreement(serving_gen, disc, q_disc, loader, num_images, num_samples):
+    """
+    Share of validation sketches where the int8 discriminator picks the
+    same best-of-N candidate as fp32, over num_samples dropout samples of
+    the serving generator (as drawn with STOCHASTIC_DROPOUT=1).
+    """
+    agreed = 0
+    with torch.no_grad():
+        for x, _ in itertools.islice(loader, num_images):
+            inputs = x.to(device).expand(num_samples, -1, -1, -1)
+            fakes = serving_gen(inputs)  # dropout differs per element
+            fp32 = disc(inputs, fakes).flatten(1).mean(dim=1)
+            int8 = q_disc(inputs, fakes).flatten(1).mean(dim=1)
+            agreed += int(fp32.argmax() == int8.argmax())
+    return agreed / min(num_images, len(loader))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gen", required=True, help="generator checkpoint (.pth / .pth.tar / .safetensors)")
+    parser.add_argument("--disc", required=True, help="discriminator checkpoint (.pth / .pth.tar / .safetensors)")
+    parser.add_argument("--calib-dir", required=True, help="ImageDataset directory used for calibration")
+    parser.add_argument("--val-dir", required=True, help="ImageDataset directory used for the quality gate")
+    parser.add_argument("--calib-batches", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--val-images", type=int, default=64)
+    parser.add_argument("--min-psnr", type=float, default=25.0)
+    parser.add_argument("--min-ssim", type=float, default=0.85)
+    parser.add_argument("--max-lpips", type=float, default=0.10)
+    parser.add_argument("--num-samples", type=int, default=5, help="best-of-N candidates for the ranking check")
+    parser.add_argument("--min-rank-agreement", type=float, default=0.8,
+                        help="share of images where int8 and fp32 discriminators pick the same candidate")
+    parser.add_argument("--force", action="store_true", help="save even if the quality gate fails")
+    args = parser.parse_args()
+
+    gen = Generator().to(device)
+    disc = Discriminator(in_channels=3).to(device)
+    gen.load_state_dict(load_weights(args.gen, device))
+    disc.load_state_dict(load_weights(args.disc, device))
+    gen.eval()
+    disc.eval()
+
+    calib_loader = DataLoader(ImageDataset(root_dir=args.calib_dir), batch_size=args.batch_size, shuffle=True)
+    val_loader = DataLoader(ImageDataset(root_dir=args.val_dir), batch_size=1, shuffle=False)
+
+    q_gen, q_disc = calibrate_pair(gen, disc, calib_loader, args.calib_batches)
+
+    report = quality_report(gen, q_gen, val_loader, args.val_images)
+    serving_gen = set_dropout(load_serving_generator(args.gen, device), True)
+    report["rank_agreement"] = ranking_agreement(serving_gen, disc, q_disc, val_loader, args.val_images, args.num_samples)
+    print(
+        f"int8 vs fp32 over {args.val_images} images | PSNR {report['psnr']:.2f} dB | "
+        f"SSIM {report['ssim']:.4f} | LPIPS {report['lpips']:.4f} | "
+        f"same best-of-{args.num_samples} pick {report['rank_agreement']:.1%}"
+    )
+
+    passed = (
+        report["psnr"] >= args.min_psnr
+        and report["ssim"] >= args.min_ssim
+        and report["lpips"] <= args.max_lpips
+        and report["rank_agreement"] >= args.min_rank_agreement
+    )
+    if not passed and not args.force:
+        raise SystemExit("Quality gate failed, quantized models not saved (use --force to override)")
+
+    for model, checkpoint in [(q_gen, args.gen), (q_disc, args.disc)]:
+        path = quantized_path(checkpoint)
+        torch.jit.save(torch.jit.script(model), path)
+        print(f"=> Saved {path} ({os.path.getsize(path) / 2**20:.1f} MiB)")
+
+
+if __name__ == "__main__":
+    main()
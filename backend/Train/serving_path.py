@@ -0,0 +1,17 @@
+"""
+Makes the server's modules (backend/) importable from the Train scripts
+that share its code:
+
+    import serving_path  # noqa: F401
+    from apiUtils import best_of_n
+
+backend/ is appended after Train/, so Train's own deepGenerator and
+discriminator still win where the names are the same.
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
@@ -43,6 +43,7 @@ def evaluate_folder_ssim(folder):
     return total / len(paths)
 
 
-folder = "SceneValOutputs"   # YOUR FOLDER NAME
-avg_ssim = evaluate_folder_ssim(folder)
-print("Average SSIM:", avg_ssim)
+if __name__ == "__main__":
+    folder = "SceneValOutputs"   # YOUR FOLDER NAME
+    avg_ssim = evaluate_folder_ssim(folder)
+    print("Average SSIM:", avg_ssim)
@@ -6,6 +6,7 @@ import os
 from deepGenerator import Generator
 from dataset import ImageDataset
 import config
+from utils import load_weights
 
 
 
@@ -25,9 +26,8 @@ val_loader = DataLoader(val_dataset, batch_size=1, shuffle=False)
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 generator = Generator()  # your Pix2Pix generator class
-checkpoint = torch.load("finalObjectGen.pth", map_location=config.DEVICE)
-    
-generator.load_state_dict(checkpoint["state_dict"])
+# .pth / .pth.tar or .safetensors
+generator.load_state_dict(load_weights("finalObjectGen.pth"))
 # generator.load_state_dict(torch.load("agen.pth.tar", map_location=device))
 generator.to(device)
 generator.eval()
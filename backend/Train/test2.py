@@ -6,6 +6,7 @@ from deepGenerator import Generator
 from discriminator import Discriminator
 from dataset import ImageDataset
 import config
+from utils import load_weights
 from torch import nn
 
 # -------------------------------
@@ -27,11 +28,9 @@ device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 gen = Generator().to(device)
 disc = Discriminator(in_channels=3).to(device)
 
-gen_ckpt = torch.load(CHECKPOINT_GEN, map_location=device)
-disc_ckpt = torch.load(CHECKPOINT_DISC, map_location=device)
-
-gen.load_state_dict(gen_ckpt["state_dict"])
-disc.load_state_dict(disc_ckpt["state_dict"])
+# .pth / .pth.tar or .safetensors
+gen.load_state_dict(load_weights(CHECKPOINT_GEN, device))
+disc.load_state_dict(load_weights(CHECKPOINT_DISC, device))
 
 gen.eval()
 disc.eval()
@@ -3,13 +3,16 @@ from utils import save_checkpoint, load_checkpoint, save_some_examples
 import torch.nn as nn
 import torch.optim as optim
 import config
-from dataset import ImageDataset
+from augment import BatchAugment
+from dataset import ImageDataset, PackedImageDataset
 from deepGenerator import Generator
 from discriminator import Discriminator
-from torch.utils.data import DataLoader
+from loader import DevicePrefetcher, build_loaders
 from tqdm import tqdm
 import lpips_calc
+import time
 import warnings
+from instrument import ProfilerWindow, StepLog, StepTimer, profile_layers
 warnings.filterwarnings("ignore", category=UserWarning, module="torchvision.models._utils")
 loss_fn = lpips_calc.LPIPS(net='vgg').to(config.DEVICE)
 
@@ -33,49 +36,61 @@ def soft_masked_l1_loss(fake, target, base_weight=0.2):
     loss = (diff * weights).mean()
     return loss
 
-def train_fn(disc, gen, loader, opt_disc, opt_gen, L1_LOSS, BCE, g_scaler, d_scaler):
+def train_fn(disc, gen, loader, opt_disc, opt_gen, L1_LOSS, BCE, g_scaler, d_scaler, epoch=0, step_log=None, profiler=None):
     loop = tqdm(loader, leave=True)
     disc_loss_total = 0
     gen_loss_total = 0
     l1_loss_total = 0
     adv_loss_total = 0
 
+    # Per-iteration stage times for step_log (instrument.StepLog)
+    timer = StepTimer(config.DEVICE, enabled=step_log is not None and step_log.enabled)
+    if step_log is not None:
+        step_log.start_epoch()
+
+    # Batches come from a loader.DevicePrefetcher, already on config.DEVICE
+    data_start = time.perf_counter()
     for idx, (x, y) in enumerate(loop):
-        x, y = x.to(config.DEVICE), y.to(config.DEVICE)
+        timer.add("data", (time.perf_counter() - data_start) * 1000)
+        if profiler is not None:
+            profiler.step(epoch, idx)
 
         # --------------------
         # Train Discriminator
         # --------------------
-        with torch.amp.autocast(device_type="cuda"):
-            y_fake = gen(x)
-            D_real = disc(x, y)
-            D_fake = disc(x, y_fake.detach())
-            D_real_loss = BCE(D_real, torch.ones_like(D_real))
-            D_fake_loss = BCE(D_fake, torch.zeros_like(D_fake))
-            D_loss = (D_fake_loss + D_real_loss) / 2
-
-        disc.zero_grad()
-        d_scaler.scale(D_loss).backward()
-        d_scaler.step(opt_disc)
-        d_scaler.update()
+        with timer.span("disc"):
+            with torch.amp.autocast(device_type="cuda"):
+                y_fake = gen(x)
+                D_real = disc(x, y)
+                D_fake = disc(x, y_fake.detach())
+                D_real_loss = BCE(D_real, torch.ones_like(D_real))
+                D_fake_loss = BCE(D_fake, torch.zeros_like(D_fake))
+                D_loss = (D_fake_loss + D_real_loss) / 2
+
+            disc.zero_grad()
+            d_scaler.scale(D_loss).backward()
+            d_scaler.step(opt_disc)
+            d_scaler.update()
 
         # ----------------
         # Train Generator
         # ----------------
-        for _ in range(2):
-            with torch.amp.autocast(device_type="cuda"):
-                y_fake = gen(x)
-                D_fake = disc(x, y_fake)
-                adv_loss = BCE(D_fake, torch.ones_like(D_fake))
-                l1_loss = L1_LOSS(y_fake, y)
-                
-                
-                loss_percep = loss_fn(y_fake, y).mean()
-                G_loss = adv_loss  + 5 * l1_loss + loss_percep
-            opt_gen.zero_grad()
-            g_scaler.scale(G_loss).backward()
-            g_scaler.step(opt_gen)
-            g_scaler.update()
+        for step in range(2):
+            with timer.span(f"gen_step_{step + 1}"):
+                with torch.amp.autocast(device_type="cuda"):
+                    y_fake = gen(x)
+                    D_fake = disc(x, y_fake)
+                    adv_loss = BCE(D_fake, torch.ones_like(D_fake))
+                    l1_loss = L1_LOSS(y_fake, y)
+                    
+                    
+                    with timer.span("lpips"):
+                        loss_percep = loss_fn(y_fake, y).mean()
+                    G_loss = adv_loss  + 5 * l1_loss + loss_percep
+                opt_gen.zero_grad()
+                g_scaler.scale(G_loss).backward()
+                g_scaler.step(opt_gen)
+                g_scaler.update()
 
         # Track losses
         disc_loss_total += D_loss.item()
@@ -83,6 +98,16 @@ def train_fn(disc, gen, loader, opt_disc, opt_gen, L1_LOSS, BCE, g_scaler, d_sca
         l1_loss_total += l1_loss.item()
         adv_loss_total += adv_loss.item()
 
+        if timer.enabled:
+            step_log.step(epoch, idx, x.size(0), timer.times())
+        data_start = time.perf_counter()
+
+    if profiler is not None:
+        profiler.close()
+    if step_log is not None:
+        stall = {"loader_stall_s": round(loader.stall_seconds, 3)} if hasattr(loader, "stall_seconds") else None
+        step_log.end_epoch(epoch, stall)
+
     return (
         disc_loss_total / len(loader),
         gen_loss_total / len(loader),
@@ -125,23 +150,47 @@ def main():
         load_checkpoint(config.CHECKPOINT_DISC , disc ,opt_disc, config.DISC_LEARNING_RATE)
 
     # Dataloaders
-    train_dataset = ImageDataset(root_dir=config.TRAIN_DIR)
-    train_loader = DataLoader(train_dataset, batch_size=config.BATCH_SIZE, shuffle=True, num_workers=config.NUM_WORKERS)
-
-    val_dataset = ImageDataset(root_dir="CombinedDataset/val")
-    val_loader = DataLoader(val_dataset, batch_size=6, shuffle=False)
+    if config.TRAIN_PACKED:
+        train_dataset = PackedImageDataset(config.TRAIN_PACKED, raw=config.GPU_AUGMENT)
+    else:
+        train_dataset = ImageDataset(root_dir=config.TRAIN_DIR, raw=config.GPU_AUGMENT)
+    augment = None
+    if config.GPU_AUGMENT:
+        augment = BatchAugment(jitter_input=config.JITTER_INPUT, jitter_target=config.JITTER_TARGET)
+
+    if config.VAL_PACKED:
+        val_dataset = PackedImageDataset(config.VAL_PACKED)
+    else:
+        val_dataset = ImageDataset(root_dir="CombinedDataset/val")
+
+    train_loader, val_loader = build_loaders(train_dataset, val_dataset)
+    train_batches = DevicePrefetcher(train_loader, config.DEVICE, transform=augment)
+    # The same examples every epoch, loaded once
+    val_batch = next(iter(val_loader))
+
+    # Instrumentation
+    step_log = StepLog(config.STEP_LOG, config.DEVICE)
+    if config.LAYER_PROFILE:
+        profile_layers(gen, disc, config.PROFILE_DIR, config.BATCH_SIZE)
+    profiler = None
+    if config.PROFILE_EPOCH is not None:
+        profiler = ProfilerWindow(config.PROFILE_EPOCH, *config.PROFILE_ITERS, config.PROFILE_DIR, config.DEVICE)
 
     # Training loop
     for epoch in range(start_epoch, config.NUM_EPOCHS):
         print(f"Starting epoch {epoch+1}/{config.NUM_EPOCHS}")
-        d_loss, g_loss, l1_loss, adv_loss = train_fn(disc, gen, train_loader, opt_disc, opt_gen, L1_LOSS, BCE, g_scaler, d_scaler)
+        d_loss, g_loss, l1_loss, adv_loss = train_fn(
+            disc, gen, train_batches, opt_disc, opt_gen, L1_LOSS, BCE, g_scaler, d_scaler,
+            epoch + 1, step_log, profiler,
+        )
         log_text = (
             f"Epoch [{epoch+1}/{config.NUM_EPOCHS}] | "
             f"D Loss: {d_loss:.4f} | "
             f"G Loss: {g_loss:.4f} | "
             f"L1 Loss: {l1_loss:.4f} | "
             f"Adv Loss: {adv_loss:.4f} | "
-            f"p Loss: {(g_loss-adv_loss - 5 * l1_loss):.4f}"
+            f"p Loss: {(g_loss-adv_loss - 5 * l1_loss):.4f} | "
+            f"Loader stall: {train_batches.stall_seconds:.1f}s"
         ) 
         print(log_text)
         append_to_file("losses.txt", log_text)      
@@ -151,7 +200,9 @@ def main():
             save_checkpoint(disc, opt_disc,epoch+1, filename=config.CHECKPOINT_DISC)
 
         # Save some validation examples
-        save_some_examples(gen, val_loader, epoch+1, folder="Evaluation")
+        save_some_examples(gen, val_batch, epoch+1, folder="Evaluation")
+
+    step_log.close()
 
 
 if __name__ == "__main__":
@@ -1,10 +1,18 @@
+import importlib.util
+import os
 import torch
 import config
+from serving_path import BACKEND_DIR
 from torchvision.utils import save_image
 
 def save_some_examples(gen, val_loader, epoch, folder):
-    x, y = next(iter(val_loader))
-    x, y = x.to(config.DEVICE), y.to(config.DEVICE)
+    """
+    val_loader: a DataLoader (its first batch is loaded) or an (x, y)
+    batch loaded once, so every epoch shows the same examples without
+    starting the loader again.
+    """
+    x, y = val_loader if isinstance(val_loader, (tuple, list)) else next(iter(val_loader))
+    x, y = x.to(config.DEVICE, non_blocking=True), y.to(config.DEVICE, non_blocking=True)
     gen.eval()
     with torch.no_grad():
         y_fake = gen(x)
@@ -25,8 +33,48 @@ def save_checkpoint(model, optimizer, epoch=0, filename="my_checkpoint.pth.tar")
     }
     torch.save(checkpoint, filename)
 
+def load_weights(checkpoint_file, device=config.DEVICE):
+    """
+    state_dict from a training checkpoint (.pth / .pth.tar) or from an
+    inference-only .safetensors file, which is memory-mapped instead of read.
+    """
+    if checkpoint_file.endswith(".safetensors"):
+        from safetensors.torch import load_file
+        return load_file(checkpoint_file, device=str(device))
+    return torch.load(checkpoint_file, map_location=device)["state_dict"]
+
+
+def load_serving_generator(checkpoint_file, device=config.DEVICE):
+    """
+    The Generator as the server builds it (backend/deepGenerator.py, which
+    has dropout in up1-3 where this one has none) with these weights, in
+    eval mode. Turn its dropout on with engine.set_dropout to sample
+    candidates the way STOCHASTIC_DROPOUT=1 does.
+    """
+    # Loaded by path: it shares its module name with Train's deepGenerator
+    path = os.path.join(BACKEND_DIR, "deepGenerator.py")
+    spec = importlib.util.spec_from_file_location("serving_deepGenerator", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    gen = module.Generator().to(device)
+    gen.load_state_dict(load_weights(checkpoint_file, device))
+    return gen.eval()
+
+
 def load_checkpoint(checkpoint_file, model, optimizer, lr):
     print("=> Loading checkpoint")
+    if checkpoint_file.endswith(".safetensors"):
+        # Weights only: the optimizer starts fresh and the epoch comes from the metadata
+        from safetensors import safe_open
+        with safe_open(checkpoint_file, framework="pt") as f:
+            epoch = (f.metadata() or {}).get("epoch", "0")
+        model.load_state_dict(load_weights(checkpoint_file))
+        print("=> No optimizer state in safetensors checkpoint, optimizer not restored")
+        for param_group in optimizer.param_groups:
+            param_group["lr"] = lr
+        return int(epoch) if epoch.isdigit() else 0
+
     checkpoint = torch.load(checkpoint_file, map_location=config.DEVICE)
     
     model.load_state_dict(checkpoint["state_dict"])
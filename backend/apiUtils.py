@@ -2,30 +2,77 @@ import cv2
 import numpy as np
 from PIL import Image
 import torch
-import torchvision.transforms as T
+import torch.nn as nn
 import matplotlib.pyplot as plt
 from deepGenerator import Generator
 from discriminator import Discriminator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import contextvars
+import hashlib
+import threading
+from metrics import span
 import io
+import os
 
 # -------------------------
 # Device
 # -------------------------
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+DILATE_KERNEL = np.ones((2, 2), np.uint8)
+
+# Upload decoding for preprocess_batch; cv2 and PIL release the GIL while
+# decoding and resizing, so the threads run in parallel
+_decode_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix="decode")
+
 # -------------------------
 # Preprocessing Functions
 # -------------------------
-def edge_detect_sketch(image_path, size=256):
+def decode_image(image_bytes):
+    """
+    Decode raw upload bytes straight to a BGR ndarray, in memory.
+    Falls back to PIL for formats OpenCV cannot decode (e.g. GIF).
+    EXIF orientation is ignored, as PIL (and so the previous decode path) does.
+    """
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if img is None:
+        try:
+            pil_img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+        except Exception:
+            raise ValueError("Cannot read image!")
+        img = cv2.cvtColor(np.asarray(pil_img), cv2.COLOR_RGB2BGR)
+    return img
+
+
+def edge_detect_sketch(image, size=256):
     """
     Convert camera/scanned image to a clean sketch using edge detection.
     Lines will be fully black, background fully white.
+    image can be a BGR ndarray, raw encoded bytes or a file path.
     Returns a PIL Image, square, resized, 3-channel RGB.
     """
-    img = cv2.imread(image_path)
-    if img is None:
-        raise ValueError("Cannot read image!")
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if isinstance(image, np.ndarray):
+        img = image
+    elif isinstance(image, (bytes, bytearray, memoryview)):
+        img = decode_image(image)
+    else:
+        img = cv2.imread(image)
+        if img is None:
+            raise ValueError("Cannot read image!")
+
+    # 1-5. Edge map, 6-7. square canvas resized to size x size
+    square_resized = square_resize(sketch_edges(img), size)
+
+    # 8. Convert to RGB
+    pil_img = Image.fromarray(square_resized).convert("RGB")
+    return pil_img
+
+
+def sketch_edges(img):
+    """Black-on-white edge map of a BGR (or grayscale) ndarray, same size."""
+    # 1. Grayscale (uploads that are already single-channel are used as is)
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
     # 2. Apply Gaussian blur to reduce camera noise
     blur = cv2.GaussianBlur(gray, (5,5), 0)
@@ -40,26 +87,23 @@ def edge_detect_sketch(image_path, size=256):
     )
 
     # 4. Optional: Morphological operations to make edges thicker/solid
-    kernel = np.ones((2,2), np.uint8)
-    edges = cv2.dilate(thresh, kernel, iterations=1)
+    edges = cv2.dilate(thresh, DILATE_KERNEL, iterations=1)
 
     # 5. Invert so lines are black, background white
-    edges = 255 - edges
+    return cv2.bitwise_not(edges, dst=edges)
 
-    # 6. Make square canvas
+
+def square_resize(edges, size, dst=None):
+    """Center edges on a white square canvas and resize it to size x size (into dst if given)."""
     h, w = edges.shape
     side = max(h, w)
-    square = np.ones((side, side), dtype=np.uint8) * 255
     y_offset = (side - h) // 2
     x_offset = (side - w) // 2
-    square[y_offset:y_offset+h, x_offset:x_offset+w] = edges
-
-    # 7. Resize to 256x256
-    square_resized = cv2.resize(square, (size, size), interpolation=cv2.INTER_AREA)
-
-    # 8. Convert to RGB
-    pil_img = Image.fromarray(square_resized).convert("RGB")
-    return pil_img
+    square = cv2.copyMakeBorder(
+        edges, y_offset, side - h - y_offset, x_offset, side - w - x_offset,
+        cv2.BORDER_CONSTANT, value=255,
+    )
+    return cv2.resize(square, (size, size), dst=dst, interpolation=cv2.INTER_AREA)
 
 
 # -------------------------
@@ -71,27 +115,298 @@ def norm(x):
 def denorm(x):
     return (x + 1) / 2
 
+# -------------------------
+# Seeded Sampling
+# -------------------------
+SEED_RANGE = 2**63
+
+
+def candidate_seeds(seed, num_samples):
+    """Seeds of the candidates drawn for a request seed: seed, seed + 1, ..."""
+    return [(seed + k) % SEED_RANGE for k in range(num_samples)]
+
+
+def content_seed(image_bytes):
+    """Default seed of an upload, so an unseeded request is reproducible too."""
+    return int.from_bytes(hashlib.sha256(image_bytes).digest()[:8], "big") % SEED_RANGE
+
+
+def _per_input(seed, b):
+    """None, one seed for every input, or one seed per input → list of b seeds (or None)."""
+    if seed is None:
+        return None
+    if isinstance(seed, int):
+        return [seed] * b
+    return list(seed)
+
+
+# Seeds of the batch being generated on this thread / task, read by the
+# dropout hooks; None = plain dropout
+_dropout_seeds = contextvars.ContextVar("dropout_seeds", default=None)
+_install_lock = threading.Lock()
+
+
+def install_seeded_dropout(gen):
+    """
+    Give every nn.Dropout layer of an eager gen a permanent forward hook
+    that draws its masks from the seeds set by seeded_sampling. Done once,
+    when the model is loaded: the hooks never change afterwards, so
+    concurrent requests sharing the model only differ in their own
+    (per-thread) seeds. Returns gen; a no-op for compiled / exported models.
+    """
+    if not _hookable(gen):
+        return gen
+    with _install_lock:
+        for index, layer in enumerate(m for m in gen.modules() if isinstance(m, nn.Dropout)):
+            if getattr(layer, "seeded_dropout_index", None) is None:
+                layer.seeded_dropout_index = index
+                layer.register_forward_hook(SeededDropout(index))
+    return gen
+
+
+def _hookable(gen):
+    return isinstance(gen, nn.Module) and not isinstance(gen, torch.jit.ScriptModule)
+
+
+@contextmanager
+def seeded_sampling(gen, seeds, device):
+    """
+    Draw the dropout masks of batch element i from seeds[i], so every
+    candidate depends only on its input and its own seed: not on the batch
+    it was drawn in, nor on the global RNG.
+
+    Masks are applied by the install_seeded_dropout hooks of eager models,
+    which read seeds from a context variable, so requests running
+    concurrently on the same model never see each other's seeds.
+    Compiled / exported models cannot be hooked; for those the global RNG
+    is seeded with seeds[0] instead, which is reproducible for the same
+    batch only (and not while other requests draw from it).
+    """
+    if _hookable(gen):
+        install_seeded_dropout(gen)  # already done if loaded by the server
+        token = _dropout_seeds.set(list(seeds))
+        try:
+            yield
+        finally:
+            _dropout_seeds.reset(token)
+        return
+
+    devices = [device] if device.type == "cuda" else []
+    with torch.random.fork_rng(devices=devices):
+        torch.manual_seed(seeds[0])
+        yield
+
+
+class SeededDropout:
+    """Forward hook of the index-th dropout layer (a class, so models with it still pickle to workers)."""
+    def __init__(self, index):
+        self.index = index
+
+    def __call__(self, module, inputs, output):
+        seeds = _dropout_seeds.get()
+        if seeds is None or not module.training or module.p == 0:
+            return None
+        x = inputs[0]
+        if len(seeds) != x.size(0):
+            raise RuntimeError(f"seeded_sampling got {len(seeds)} seeds for a batch of {x.size(0)}")
+        keep = 1 - module.p
+        masks = []
+        for seed in seeds:
+            g = torch.Generator(device=x.device)
+            g.manual_seed(hash((seed, self.index)) % SEED_RANGE)
+            masks.append(torch.rand(x.shape[1:], generator=g, device=x.device) < keep)
+        return x * torch.stack(masks) / keep
+
+
+# -------------------------
+# Best-of-N Sampling
+# -------------------------
+def best_of_n(input_tensor, gen, disc, num_samples=5, batched=True, seed=None, return_seeds=False):
+    """
+    Draw num_samples candidates per input and keep the one the
+    discriminator scores highest.
+
+    input_tensor is (B, 3, H, W); returns the best fake for each input,
+    shape (B, 3, H, W).
+
+    With batched=True every input is repeated num_samples times along the
+    batch dimension, so the Generator and Discriminator each run once and
+    the selection happens on-device. Dropout draws an independent mask per
+    batch element and BatchNorm uses its running statistics in eval mode,
+    so each candidate is distributed exactly like one drawn in the loop.
+
+    seed (one int, or one per input) makes the sampling reproducible:
+    candidate k of an input is drawn with seed + k (see seeded_sampling).
+    return_seeds also returns the seed of each chosen candidate, which
+    re-renders it on its own with num_samples=1.
+    """
+    b = input_tensor.size(0)
+    seeds = _per_input(seed, b)
+
+    with torch.no_grad():
+        if not batched:
+            best_fake, best = _best_of_n_loop(input_tensor, gen, disc, num_samples, seeds)
+        else:
+            # (B, C, H, W) -> (B * N, C, H, W), each input's samples contiguous
+            inputs = input_tensor.repeat_interleave(num_samples, dim=0)
+            if seeds is None:
+                fakes = gen(inputs)
+            else:
+                element_seeds = [s for base in seeds for s in candidate_seeds(base, num_samples)]
+                with seeded_sampling(gen, element_seeds, input_tensor.device):
+                    fakes = gen(inputs)
+            scores = disc(inputs, fakes).flatten(1).mean(dim=1)
+
+            best = scores.view(b, num_samples).argmax(dim=1)
+            fakes = fakes.view(b, num_samples, *fakes.shape[1:])
+            best_fake = fakes[torch.arange(b, device=fakes.device), best]
+
+    if not return_seeds:
+        return best_fake
+    return best_fake, _chosen_seeds(seeds, best)
+
+
+def adaptive_best_of_n(input_tensor, gen, disc, max_samples=5, threshold=None, min_gain=None, seed=None):
+    """
+    Best-of-N with early exit.
+
+    Candidates are drawn one round at a time, each round a single batched
+    pass over the inputs that are still sampling. An input stops once its
+    best score reaches threshold, once a new candidate improves on its best
+    by less than min_gain, or after max_samples candidates. Round k draws
+    candidate k, with seed + k like best_of_n.
+
+    Returns the best fake for each input, (B, 3, H, W), the number of
+    samples each one used, (B,), and the seeds of the chosen candidates.
+    """
+    b = input_tensor.size(0)
+    seeds = _per_input(seed, b)
+    best_fake = None
+    best_score = torch.full((b,), float("-inf"), device=input_tensor.device)
+    best_round = torch.zeros(b, dtype=torch.long, device=input_tensor.device)
+    used = torch.zeros(b, dtype=torch.long, device=input_tensor.device)
+    active = torch.ones(b, dtype=torch.bool, device=input_tensor.device)
+
+    with torch.no_grad():
+        for k in range(max_samples):
+            idx = active.nonzero().flatten()
+            if idx.numel() == 0:
+                break
+
+            x = input_tensor[idx]
+            if seeds is None:
+                fake = gen(x)
+            else:
+                with seeded_sampling(gen, [(seeds[i] + k) % SEED_RANGE for i in idx.tolist()], x.device):
+                    fake = gen(x)
+            score = disc(x, fake).flatten(1).mean(dim=1)
+            if best_fake is None:
+                best_fake = fake.new_empty((b, *fake.shape[1:]))
+
+            gain = score - best_score[idx]
+            better = gain > 0
+            best_fake[idx[better]] = fake[better]
+            best_round[idx[better]] = k
+            best_score[idx] = torch.maximum(best_score[idx], score)
+            used[idx] += 1
+
+            done = torch.zeros_like(better)
+            if threshold is not None:
+                done |= best_score[idx] >= threshold
+            if min_gain is not None:
+                done |= (used[idx] > 1) & (gain < min_gain)
+            active[idx[done]] = False
+
+    return best_fake, used, _chosen_seeds(seeds, best_round)
+
+
+def generate_batch(inputs, gen, disc, num_samples=5, seed=None, threshold=None, min_gain=None,
+                   deterministic=False):
+    """
+    Best-of-N for a batch of independent requests. seed is one int or one
+    per request (None = unseeded). Returns the outputs, the number of
+    samples each one used and the seeds of the chosen candidates.
+
+    threshold / min_gain switch to adaptive_best_of_n, with num_samples as
+    the cap. deterministic draws every candidate in its own batch-of-one
+    pass, so a chosen candidate re-rendered from its seed is bit-identical
+    and not merely equal up to floating-point noise.
+    """
+    seeds = _per_input(seed, inputs.size(0))
+    adaptive = threshold is not None or min_gain is not None
+
+    if deterministic:
+        results = []
+        for i, x in enumerate(inputs):
+            s = seeds[i] if seeds is not None else None
+            if adaptive:
+                results.append(adaptive_best_of_n(x.unsqueeze(0), gen, disc, num_samples, threshold, min_gain, s))
+            else:
+                fake, chosen = best_of_n(x.unsqueeze(0), gen, disc, num_samples, batched=False, seed=s, return_seeds=True)
+                results.append((fake, torch.tensor([num_samples]), chosen))
+        outputs = torch.cat([fake for fake, _, _ in results])
+        used = torch.cat([n.cpu() for _, n, _ in results])
+        return outputs, used, [s for _, _, chosen in results for s in chosen]
+
+    if adaptive:
+        outputs, used, chosen = adaptive_best_of_n(inputs, gen, disc, num_samples, threshold, min_gain, seeds)
+        return outputs, used.cpu(), chosen
+
+    outputs, chosen = best_of_n(inputs, gen, disc, num_samples, seed=seeds, return_seeds=True)
+    return outputs, torch.full((inputs.size(0),), num_samples, dtype=torch.long), chosen
+
+
+def sample_candidate(input_tensor, gen, disc, seed=None):
+    """
+    One Generator pass for a single (1, 3, H, W) input and its mean
+    Discriminator score, for callers that want every candidate.
+    """
+    with torch.no_grad():
+        if seed is None:
+            fake = gen(input_tensor)
+        else:
+            with seeded_sampling(gen, [seed], input_tensor.device):
+                fake = gen(input_tensor)
+        score = disc(input_tensor, fake).mean().item()
+    return fake[0], score
+
+
+def _best_of_n_loop(input_tensor, gen, disc, num_samples, seeds=None):
+    """Reference implementation: one forward pass per sample. Returns the best fakes and their indices."""
+    best_fake = None
+    best_score = None
+    best_index = torch.zeros(input_tensor.size(0), dtype=torch.long, device=input_tensor.device)
+
+    for k in range(num_samples):
+        if seeds is None:
+            fake = gen(input_tensor)
+        else:
+            with seeded_sampling(gen, [(s + k) % SEED_RANGE for s in seeds], input_tensor.device):
+                fake = gen(input_tensor)
+        score = disc(input_tensor, fake).flatten(1).mean(dim=1)
+        if best_fake is None:
+            best_fake, best_score = fake.clone(), score
+        else:
+            better = score > best_score
+            best_fake[better] = fake[better]
+            best_score = torch.where(better, score, best_score)
+            best_index[better] = k
+
+    return best_fake, best_index
+
+
+def _chosen_seeds(seeds, best):
+    if seeds is None:
+        return [None] * len(best)
+    return [(s + k) % SEED_RANGE for s, k in zip(seeds, best.tolist())]
+
+
 # -------------------------
 # Full Pipeline
 # -------------------------
 def preprocess_object(image_bytes):
-    """Object generation → use edge detection."""
-    # Load PIL
-    pil_img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    
-    # Convert to cv2 to reuse your edge detector
-    temp = io.BytesIO()
-    pil_img.save(temp, format="PNG")
-    temp.seek(0)
-
-    cv_img = cv2.imdecode(
-        np.frombuffer(temp.read(), np.uint8),
-        cv2.IMREAD_COLOR
-    )
-    cv2.imwrite("temp_input.png", cv_img)
-
-    sketch = edge_detect_sketch("temp_input.png")  # returns PIL
-    return sketch
+    """Object generation → use edge detection, entirely in memory."""
+    return edge_detect_sketch(decode_image(image_bytes))  # returns PIL
 
 
 def preprocess_scene(image_bytes):
@@ -101,45 +416,119 @@ def preprocess_scene(image_bytes):
     return img
 
 
-def process_and_generate(image_bytes, gen, disc, model_type, num_samples=5):
+def preprocess(image_bytes, model_type, timer=None):
     """
+    Decode an upload and return the normalized (1, 3, 256, 256) input tensor.
     model_type = "object" or "scene"
+    timer = metrics.StageTimer receiving decode / preprocess / to_tensor spans
+    """
+    return preprocess_batch([image_bytes], model_type, timer=timer)
+
+
+def preprocess_batch(uploads, model_type, size=256, timer=None):
+    """
+    Decode many uploads at once into a normalized (N, 3, size, size) tensor.
+
+    Uploads are decoded and resized on the decode thread pool, each straight
+    into its slot of one preallocated uint8 buffer, which is then
+    normalized in a single pass.
     """
     # -------------------------
     # Preprocessing logic
     # -------------------------
-    if model_type == "object":
-        input_pil = preprocess_scene(image_bytes)
-    else:
-        input_pil = preprocess_scene(image_bytes)
+    # Both model types are served from the resized RGB upload
+    with span(timer, "decode"):
+        images = _map(_decode_rgb, uploads)
+
+    with span(timer, "preprocess"):
+        buffer = np.empty((len(uploads), size, size, 3), dtype=np.uint8)
+        _map(_resize_into, images, buffer, [size] * len(uploads))
 
     # -------------------------
     # Convert to tensor
     # -------------------------
-    transform = T.Compose([
-        T.ToTensor(),
-        T.Lambda(norm)
-    ])
+    with span(timer, "to_tensor"):
+        return normalize_batch(buffer)
 
-    input_tensor = transform(input_pil).unsqueeze(0).to(device)
 
-    best_fake = None
-    best_score = -float('inf')
+def sketch_batch(uploads, size=256, timer=None):
+    """Batched preprocess_object: edge-detected sketches as a normalized (N, 3, size, size) tensor."""
+    with span(timer, "decode"):
+        images = _map(decode_image, uploads)
 
-    with torch.no_grad():
-        for _ in range(num_samples):
-            fake = gen(input_tensor)
-            score = disc(input_tensor, fake).mean().item()
-            if score > best_score:
-                best_score = score
-                best_fake = fake.clone()
+    with span(timer, "preprocess"):
+        buffer = np.empty((len(uploads), size, size), dtype=np.uint8)
+        _map(_sketch_into, images, buffer, [size] * len(uploads))
+
+    with span(timer, "to_tensor"):
+        return normalize_batch(buffer)
+
+
+def normalize_batch(buffer):
+    """
+    uint8 (N, H, W, 3) RGB or (N, H, W) grayscale → float (N, 3, H, W) in
+    [-1, 1], matching ToTensor followed by norm.
+    """
+    x = torch.from_numpy(buffer)
+    x = x.unsqueeze(1).expand(-1, 3, -1, -1) if x.ndim == 3 else x.permute(0, 3, 1, 2)
+    return x.float().div_(255).sub_(0.5).mul_(2)
+
+
+def _map(fn, *args):
+    if len(args[0]) == 1:
+        return [fn(*(a[0] for a in args))]
+    # list() re-raises the first error
+    return list(_decode_pool.map(fn, *args))
 
-    fake_img = best_fake[0].detach().cpu()
+
+def _decode_rgb(image_bytes):
+    return Image.open(io.BytesIO(image_bytes)).convert("RGB")
+
+
+def _resize_into(img, out, size):
+    out[...] = np.asarray(img.resize((size, size), Image.BICUBIC))
+
+
+def _sketch_into(img, out, size):
+    square_resize(sketch_edges(img), size, dst=out)
+
+
+def tensor_to_array(fake):
+    """Convert a single (3, H, W) generator output in [-1, 1] to an RGB uint8 array."""
+    fake_img = fake.detach().cpu()
     fake_img = denorm(fake_img.permute(1, 2, 0)).numpy()
     fake_img = np.clip(fake_img, 0, 1)
-    fake_img = (fake_img * 255).astype("uint8")
+    return (fake_img * 255).astype("uint8")
+
+
+def tensor_to_pil(fake):
+    """Convert a single (3, H, W) generator output in [-1, 1] to a PIL Image."""
+    return Image.fromarray(tensor_to_array(fake))
+
+
+def process_and_generate(image_bytes, gen, disc, model_type, num_samples=5, batched=True, seed=None,
+                         threshold=None, min_gain=None, deterministic=False, return_seed=False):
+    """
+    model_type = "object" or "scene"
+    batched = draw all samples in a single Generator/Discriminator pass
+    seed = make the sampling reproducible (candidate k uses seed + k)
+    threshold / min_gain = stop sampling early (see adaptive_best_of_n)
+    deterministic = one pass per candidate, so re-rendering the chosen seed
+        with num_samples=1 gives the identical image
+    return_seed = also return the seed of the chosen candidate
+    """
+    input_tensor = preprocess(image_bytes, model_type).to(device)
+
+    if threshold is not None or min_gain is not None:
+        best_fake, _, chosen = adaptive_best_of_n(input_tensor, gen, disc, num_samples, threshold, min_gain, seed)
+    else:
+        best_fake, chosen = best_of_n(
+            input_tensor, gen, disc, num_samples, batched=batched and not deterministic, seed=seed, return_seeds=True
+        )
 
-    return Image.fromarray(fake_img)
+    if return_seed:
+        return tensor_to_pil(best_fake[0]), chosen[0]
+    return tensor_to_pil(best_fake[0])
 
 
 
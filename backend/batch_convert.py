@@ -0,0 +1,195 @@
+"""
+Convert a directory (or glob) of sketches offline, without the server.
+
+Uploads go through the same preprocess() and best-of-N selection as
+/generate, batch_size images per forward pass. DataLoader workers decode
+and preprocess the next batches while the current one runs, and a pool of
+writer threads encodes and saves the outputs in the background.
+
+Each output is written to a temporary file and renamed into place, so an
+interrupted run never leaves a truncated image behind. Running the same
+command again skips every input whose output already exists. Files under
+--output are never taken as inputs, and inputs that would be written to
+the same output (a.png and a.jpg) are refused.
+
+Without --seed (or SEED), each image is seeded from its file content as
+/generate seeds an upload, so both give the same output for it.
+
+Usage:
+    python batch_convert.py sketches/ --output results/ --model-type object
+    python batch_convert.py "scans/*.jpg" --output results/ --model-type scene --format webp
+"""
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import torch
+from torch.utils.data import DataLoader, Dataset
+from tqdm import tqdm
+from apiUtils import content_seed, generate_batch, preprocess, tensor_to_array
+from checkpoints import load_model
+from deepGenerator import Generator
+from discriminator import Discriminator
+from encoding import FORMATS, encode_image
+from engine import set_dropout
+import settings
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".webp", ".gif", ".tif", ".tiff")
+
+
+def _inside(path, directory):
+    path, directory = os.path.abspath(path), os.path.abspath(directory)
+    return os.path.commonpath([path, directory]) == directory
+
+
+def find_inputs(sources, exclude=None):
+    """
+    Image files under each directory (recursively) or matching each glob,
+    leaving out anything under exclude (the output directory), with their
+    common root.
+    """
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                if exclude is not None:
+                    dirs[:] = [d for d in dirs if not _inside(os.path.join(root, d), exclude)]
+                paths += [os.path.join(root, f) for f in files if f.lower().endswith(IMAGE_EXTENSIONS)]
+        else:
+            paths += [p for p in glob.glob(source, recursive=True) if os.path.isfile(p)]
+
+    if exclude is not None:
+        paths = [p for p in paths if not _inside(p, exclude)]
+    paths = sorted(set(paths))
+    if not paths:
+        return [], None
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
+    return paths, root
+
+
+def output_path(path, root, output_dir, fmt):
+    """results/<path relative to root, extension swapped for fmt>"""
+    rel = os.path.relpath(os.path.abspath(path), root)
+    return os.path.join(output_dir, os.path.splitext(rel)[0] + FORMATS[fmt][1])
+
+
+class SketchDataset(Dataset):
+    """
+    Preprocessed (3, 256, 256) inputs with their seeds (seed, or else
+    derived from the file as /generate does); unreadable files come back
+    as None.
+    """
+    def __init__(self, paths, model_type, seed=None):
+        self.paths = paths
+        self.model_type = model_type
+        self.seed = seed
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        try:
+            with open(self.paths[index], "rb") as f:
+                image_bytes = f.read()
+            seed = self.seed if self.seed is not None else content_seed(image_bytes)
+            return index, preprocess(image_bytes, self.model_type)[0], seed
+        except (OSError, ValueError) as e:
+            print(f"Skipping {self.paths[index]}: {e}")
+            return index, None, None
+
+
+def collate(items):
+    items = [item for item in items if item[1] is not None]
+    if not items:
+        return [], None, []
+    return [i for i, _, _ in items], torch.stack([x for _, x, _ in items]), [s for _, _, s in items]
+
+
+def write_output(output, path, fmt):
+    content, _, _ = encode_image(output, fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="directories and/or glob patterns")
+    parser.add_argument("--output", required=True, help="output directory (input layout is mirrored)")
+    parser.add_argument("--model-type", choices=list(settings.CHECKPOINTS), required=True)
+    parser.add_argument("--gen", help="generator checkpoint (default: the one served for --model-type)")
+    parser.add_argument("--disc", help="discriminator checkpoint (default: the one served for --model-type)")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--num-samples", type=int, default=settings.NUM_SAMPLES)
+    parser.add_argument("--seed", type=int, default=settings.SEED,
+                        help="one seed for every image (default: SEED, else each image's content seed)")
+    parser.add_argument("--workers", type=int, default=2, help="DataLoader preprocessing processes")
+    parser.add_argument("--writers", type=int, default=4, help="encoder / writer threads")
+    parser.add_argument("--format", choices=list(FORMATS), default=settings.OUTPUT_FORMAT)
+    parser.add_argument("--overwrite", action="store_true", help="regenerate outputs that already exist")
+    args = parser.parse_args()
+
+    paths, root = find_inputs(args.inputs, exclude=args.output)
+    targets = {p: output_path(p, root, args.output, args.format) for p in paths}
+
+    # Same stem, different extension: one output would overwrite the other
+    sources = {}
+    for p, target in targets.items():
+        sources.setdefault(target, []).append(p)
+    collisions = [names for names in sources.values() if len(names) > 1]
+    if collisions:
+        listed = "\n".join("  " + ", ".join(names) for names in collisions[:10])
+        raise SystemExit(f"{len(collisions)} outputs would be written by more than one input:\n{listed}")
+    todo = [p for p in paths if args.overwrite or not os.path.exists(targets[p])]
+    print(f"{len(paths)} inputs, {len(paths) - len(todo)} already converted, {len(todo)} to go")
+    if not todo:
+        return
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    gen_path, disc_path = settings.CHECKPOINTS[args.model_type]
+    gen = load_model(Generator, args.gen or gen_path, device)
+    disc = load_model(lambda: Discriminator(in_channels=3), args.disc or disc_path, device)
+    gen.eval()
+    disc.eval()
+    set_dropout(gen, settings.STOCHASTIC_DROPOUT)
+
+    loader = DataLoader(
+        SketchDataset(todo, args.model_type, args.seed),
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+        collate_fn=collate,
+        pin_memory=device.type == "cuda",
+        prefetch_factor=2 if args.workers else None,
+    )
+
+    start = time.perf_counter()
+    done = 0
+    pending = []
+    with ThreadPoolExecutor(max_workers=args.writers, thread_name_prefix="writer") as writers:
+        for indices, inputs, seeds in tqdm(loader, unit="batch"):
+            if inputs is None:
+                continue
+            outputs, _, _ = generate_batch(
+                inputs.to(device, non_blocking=True), gen, disc, args.num_samples, seeds,
+                settings.SCORE_THRESHOLD, settings.MIN_SCORE_GAIN, settings.DETERMINISTIC,
+            )
+            for i, output in zip(indices, outputs.cpu()):
+                pending.append(writers.submit(write_output, tensor_to_array(output), targets[todo[i]], args.format))
+
+            # Bound the outputs held in memory while the writers catch up
+            while len(pending) > 4 * args.writers * args.batch_size:
+                pending.pop(0).result()
+            done += len(indices)
+
+        for future in pending:
+            future.result()
+
+    seconds = time.perf_counter() - start
+    print(f"=> Converted {done} images in {seconds:.1f}s ({done / seconds:.2f} images/s) into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import torch
+
+
+class MicroBatcher:
+    """
+    Dynamic micro-batching for the /generate endpoint.
+
+    Requests are queued per key (e.g. model_type). A worker task per queue
+    collects up to max_batch_size inputs, waiting at most max_wait_ms after
+    the first one arrives, concatenates them and hands the batch to
+    run_batch on a dedicated inference thread, so the event loop is never
+    blocked.
+
+    run_batch(key, inputs, seeds) receives a (B, 3, H, W) tensor and the
+    seed submitted with each input, and must return one output per input,
+    in order. Up to concurrency batches run at once, across all keys.
+    """
+    def __init__(self, run_batch, max_batch_size=4, max_wait_ms=10, concurrency=1):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+
+        self._queues = {}
+        self._workers = {}
+        self._in_flight = set()
+        self._slots = asyncio.Semaphore(concurrency)
+        # One thread per concurrent batch: torch already parallelises each forward pass
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="inference")
+
+    async def submit(self, key, input_tensor, seed=None):
+        """Queue a (1, 3, H, W) input and wait for its result from run_batch."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue(key).put((input_tensor, seed, future))
+        return await future
+
+    def queue_depth(self, key):
+        queue = self._queues.get(key)
+        return queue.qsize() if queue is not None else 0
+
+    def queue_depths(self):
+        return {key: queue.qsize() for key, queue in self._queues.items()}
+
+    def in_flight(self):
+        """Batches currently running."""
+        return len(self._in_flight)
+
+    async def close(self):
+        tasks = [*self._workers.values(), *self._in_flight]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers.clear()
+        self._queues.clear()
+        self._executor.shutdown(wait=False)
+
+    def _queue(self, key):
+        if key not in self._queues:
+            self._queues[key] = asyncio.Queue()
+            self._workers[key] = asyncio.create_task(self._worker(key))
+        return self._queues[key]
+
+    async def _collect(self, queue, first):
+        loop = asyncio.get_running_loop()
+        items = [first]
+        deadline = loop.time() + self.max_wait
+
+        while len(items) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Callers that disconnected while queued don't need a result
+        return [item for item in items if not item[-1].done()]
+
+    async def _worker(self, key):
+        queue = self._queues[key]
+
+        while True:
+            first = await queue.get()
+            # Only take a slot once there is work, so an idle key never
+            # blocks the others; the batch keeps filling meanwhile
+            await self._slots.acquire()
+            items = await self._collect(queue, first)
+            if not items:
+                self._slots.release()
+                continue
+
+            task = asyncio.create_task(self._run(key, items))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _run(self, key, items):
+        loop = asyncio.get_running_loop()
+        inputs = torch.cat([x for x, _, _ in items])
+        seeds = [seed for _, seed, _ in items]
+        try:
+            outputs = await loop.run_in_executor(
+                self._executor, self.run_batch, key, inputs, seeds
+            )
+        except Exception as e:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+
+        for (_, _, future), output in zip(items, outputs):
+            if not future.done():
+                future.set_result(output)
@@ -0,0 +1,131 @@
+"""
+Benchmark object preprocessing: the old temp-file round trip
+(PIL decode → PNG re-encode → cv2.imdecode → imwrite → imread)
+against the in-memory path used by apiUtils.preprocess_object.
+Then the previous preprocess (PIL resize, a T.Compose(ToTensor, norm)
+per upload) and edge_detect_sketch one image at a time against
+apiUtils.preprocess_batch / sketch_batch over --batch uploads.
+
+Usage:
+    python bench_preprocess.py [image ...] [--repeat 50] [--batch 16]
+Without images, a synthetic 1024x768 photo-like upload and an
+EXIF-rotated JPEG are used.
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+import cv2
+import numpy as np
+import torch
+import torchvision.transforms as T
+from PIL import Image
+from apiUtils import edge_detect_sketch, norm, preprocess_batch, preprocess_object, preprocess_scene, sketch_batch
+
+
+def legacy_preprocess_object(image_bytes, workdir):
+    """The pre-change implementation, kept here only for comparison."""
+    pil_img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+
+    temp = io.BytesIO()
+    pil_img.save(temp, format="PNG")
+    temp.seek(0)
+
+    cv_img = cv2.imdecode(np.frombuffer(temp.read(), np.uint8), cv2.IMREAD_COLOR)
+    path = os.path.join(workdir, "temp_input.png")
+    cv2.imwrite(path, cv_img)
+
+    return edge_detect_sketch(path)
+
+
+def legacy_preprocess(image_bytes):
+    """The pre-batching preprocess (both model types), kept here only for comparison."""
+    input_pil = preprocess_scene(image_bytes)
+    transform = T.Compose([
+        T.ToTensor(),
+        T.Lambda(norm)
+    ])
+    return transform(input_pil).unsqueeze(0)
+
+
+def synthetic_upload(width=1024, height=768):
+    rng = np.random.default_rng(0)
+    img = np.full((height, width, 3), 235, np.uint8)
+    for _ in range(40):
+        p1 = tuple(int(v) for v in rng.integers(0, (width, height)))
+        p2 = tuple(int(v) for v in rng.integers(0, (width, height)))
+        cv2.line(img, p1, p2, (20, 20, 20), int(rng.integers(1, 5)))
+    img = cv2.add(img, rng.integers(0, 12, img.shape, dtype=np.uint8))
+    ok, buf = cv2.imencode(".png", img)
+    return buf.tobytes()
+
+
+def exif_rotated_upload(width=640, height=480):
+    """A JPEG tagged EXIF orientation 6 (rotated phone photo); must decode unrotated, like PIL."""
+    img = Image.open(io.BytesIO(synthetic_upload(width, height))).convert("RGB")
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=95, exif=exif)
+    return buf.getvalue()
+
+
+def bench(fn, image_bytes, repeat):
+    fn(image_bytes)  # warmup
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(image_bytes)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="*")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=16)
+    args = parser.parse_args()
+
+    uploads = [(p, open(p, "rb").read()) for p in args.images] or [
+        ("synthetic 1024x768", synthetic_upload()),
+        ("EXIF-rotated 640x480 JPEG", exif_rotated_upload()),
+    ]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, image_bytes in uploads:
+            legacy = np.asarray(legacy_preprocess_object(image_bytes, workdir))
+            current = np.asarray(preprocess_object(image_bytes))
+            assert np.array_equal(legacy, current), f"{name}: outputs differ"
+
+            legacy_ms = bench(lambda b: legacy_preprocess_object(b, workdir), image_bytes, args.repeat)
+            current_ms = bench(preprocess_object, image_bytes, args.repeat)
+            print(
+                f"{name}: temp-file {legacy_ms:.2f} ms | in-memory {current_ms:.2f} ms | "
+                f"speedup {legacy_ms / current_ms:.2f}x"
+            )
+
+    batch = [image_bytes for _, image_bytes in uploads] * (args.batch // len(uploads) or 1)
+    repeat = max(1, args.repeat // 10)
+
+    def one_by_one_scene(b):
+        return torch.cat([legacy_preprocess(u) for u in b])
+
+    def one_by_one_sketch(b):
+        to_tensor = lambda u: torch.from_numpy(np.array(preprocess_object(u))).permute(2, 0, 1)
+        return torch.stack([to_tensor(u) for u in b]).float().div_(255).sub_(0.5).mul_(2)
+
+    for name, single, batched in [
+        ("scene", one_by_one_scene, lambda b: preprocess_batch(b, "scene")),
+        ("sketch", one_by_one_sketch, sketch_batch),
+    ]:
+        assert torch.equal(single(batch), batched(batch)), f"{name}: batch outputs differ"
+        single_ms = bench(single, batch, repeat)
+        batched_ms = bench(batched, batch, repeat)
+        print(
+            f"{name} x{len(batch)}: one at a time {single_ms:.1f} ms | batched {batched_ms:.1f} ms | "
+            f"speedup {single_ms / batched_ms:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def checkpoint_id(*paths):
+    """
+    Identify a set of checkpoint files by name, size and modification time,
+    so cached results are invalidated when a checkpoint is replaced.
+    """
+    h = hashlib.sha256()
+    for path in paths:
+        st = os.stat(path)
+        h.update(f"{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return h.hexdigest()[:16]
+
+
+class ResultCache:
+    """
+    Content-addressed LRU cache of generated images.
+
+    Entries are RGB uint8 arrays, with a small JSON-serializable meta dict
+    (e.g. the chosen seed), keyed by make_key(). The in-memory tier is
+    bounded both by entry count and by total bytes; the least recently used
+    entries are evicted first. With disk_dir set, every entry is also
+    written there as .npz so results survive restarts; the files are kept
+    under disk_max_bytes the same way, least recently used (by mtime,
+    refreshed on every disk hit) deleted first.
+    """
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, disk_dir=None,
+                 disk_max_bytes=1024 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        self._disk = OrderedDict()  # key -> file size, least recently used first
+        self._disk_bytes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    @staticmethod
+    def make_key(image_bytes, model_type, num_samples, checkpoint, seed=None):
+        h = hashlib.sha256(image_bytes)
+        h.update(f"|{model_type}|{num_samples}|{checkpoint}|{seed}".encode())
+        return h.hexdigest()
+
+    def get(self, key):
+        """(array, meta) for key, or None."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        value = self._load(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._insert(key, value)
+        return value
+
+    def put(self, key, value, meta=None):
+        value = (value, meta or {})
+        with self._lock:
+            self._insert(key, value)
+        self._store(key, value)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "disk_bytes": self._disk_bytes,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def _insert(self, key, value):
+        nbytes = value[0].nbytes
+        if nbytes > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[0].nbytes
+        self._entries[key] = value
+        self._bytes += nbytes
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted[0].nbytes
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key + ".npz")
+
+    def _load(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                value = data["output"], json.loads(str(data["meta"]))
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        return value
+
+    def _store(self, key, value):
+        if not self.disk_dir:
+            return
+        output, meta = value
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, output=output, meta=np.array(json.dumps(meta)))
+        # Atomic, so a concurrent reader never sees a partial file
+        os.replace(tmp, path)
+
+        size = os.path.getsize(path)
+        with self._lock:
+            self._disk_bytes += size - self._disk.pop(key, 0)
+            self._disk[key] = size
+            evicted = []
+            while self._disk_bytes > self.disk_max_bytes and len(self._disk) > 1:
+                old_key, old_size = self._disk.popitem(last=False)
+                self._disk_bytes -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def _scan_disk(self):
+        """Index the files left by a previous run, oldest first."""
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".npz"):
+                st = os.stat(os.path.join(self.disk_dir, name))
+                entries.append((st.st_mtime, name[: -len(".npz")], st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
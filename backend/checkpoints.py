@@ -0,0 +1,53 @@
+import torch
+from safetensors.torch import load_file, save_file
+
+CHECKPOINT_EXTENSIONS = (".tar", ".pth", ".safetensors")
+
+
+def checkpoint_stem(path):
+    """finalObjectGen.pth / SceneDisc.pth.tar → finalObjectGen / SceneDisc (directory kept)"""
+    for ext in CHECKPOINT_EXTENSIONS:
+        if path.endswith(ext):
+            path = path[: -len(ext)]
+    return path
+
+
+def derived_path(checkpoint_path, suffix):
+    """Path of an artifact exported from a checkpoint, e.g. (SceneGen.pth.tar, ".onnx") → SceneGen.onnx"""
+    return checkpoint_stem(checkpoint_path) + suffix
+
+
+def load_model(factory, path, device):
+    """
+    Build factory() and load the weights at path into it.
+
+    .safetensors files are memory-mapped and the mapped tensors become the
+    model's parameters directly (assign=True): nothing is copied on CPU and
+    the model is built on the meta device, so no random init is paid
+    either. Anything else is read as a pickled {"state_dict": ...}
+    training checkpoint.
+    """
+    if path.endswith(".safetensors"):
+        state_dict = load_file(path, device=str(device))
+        with torch.device("meta"):
+            model = factory()
+        model.load_state_dict(state_dict, assign=True)
+        return model
+
+    model = factory().to(device)
+    model.load_state_dict(torch.load(path, map_location=device)["state_dict"])
+    return model
+
+
+def convert_to_safetensors(path, out_path=None):
+    """
+    Write the inference-only part of a training checkpoint (the state_dict,
+    no optimizer state) as <name>.safetensors and return its path.
+    """
+    checkpoint = torch.load(path, map_location="cpu")
+    state_dict = {k: v.contiguous() for k, v in checkpoint["state_dict"].items()}
+    metadata = {"source": path, "epoch": str(checkpoint.get("epoch"))}
+
+    out_path = out_path or derived_path(path, ".safetensors")
+    save_file(state_dict, out_path, metadata=metadata)
+    return out_path
@@ -0,0 +1,35 @@
+"""
+Convert training checkpoints (.pth / .pth.tar) to inference-only
+safetensors files that load memory-mapped, without copying.
+
+Usage:
+    python convert_checkpoint.py                    # every checkpoint served
+    python convert_checkpoint.py finalObjectGen.pth SceneDisc.pth.tar
+Each file is written next to its source (finalObjectGen.pth →
+finalObjectGen.safetensors); point OBJECT_GEN_CHECKPOINT etc. at it.
+"""
+import argparse
+import os
+from checkpoints import convert_to_safetensors
+import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("checkpoints", nargs="*")
+    args = parser.parse_args()
+
+    paths = args.checkpoints or [
+        p for pair in settings.CHECKPOINTS.values() for p in pair if not p.endswith(".safetensors")
+    ]
+
+    for path in paths:
+        out_path = convert_to_safetensors(path)
+        print(
+            f"{path} ({os.path.getsize(path) / 2**20:.1f} MiB) → "
+            f"{out_path} ({os.path.getsize(out_path) / 2**20:.1f} MiB)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Response image encoding with content negotiation.
+
+Outputs are encoded with cv2.imencode (libpng / libwebp / libjpeg directly,
+several times faster than PIL for PNG at a low compression level). The
+format comes from an explicit ?format= or the request's Accept header.
+"""
+import time
+import cv2
+import settings
+
+# format -> (media type, cv2 extension, encoder params)
+FORMATS = {
+    "png": ("image/png", ".png", [cv2.IMWRITE_PNG_COMPRESSION, settings.PNG_COMPRESSION]),
+    "webp": ("image/webp", ".webp", [cv2.IMWRITE_WEBP_QUALITY, settings.WEBP_QUALITY]),
+    "jpeg": ("image/jpeg", ".jpg", [cv2.IMWRITE_JPEG_QUALITY, settings.JPEG_QUALITY]),
+}
+MEDIA_TYPES = {media_type: fmt for fmt, (media_type, _, _) in FORMATS.items()}
+
+
+def negotiate(accept=None, requested=None):
+    """
+    Pick the response format: requested if given, else the supported type
+    with the highest q in the Accept header (explicit types before
+    wildcards, then header order), else settings.OUTPUT_FORMAT.
+    """
+    if requested:
+        return requested
+
+    best, best_rank = None, None
+    for position, part in enumerate((accept or "").split(",")):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    pass
+
+        if media_type in MEDIA_TYPES:
+            fmt, explicit = MEDIA_TYPES[media_type], True
+        elif media_type in ("image/*", "*/*"):
+            fmt, explicit = settings.OUTPUT_FORMAT, False
+        else:
+            continue
+
+        rank = (q, explicit, -position)
+        if q > 0 and (best_rank is None or rank > best_rank):
+            best, best_rank = fmt, rank
+
+    return best or settings.OUTPUT_FORMAT
+
+
+def encode_image(output, fmt="png"):
+    """
+    Encode an RGB uint8 array. Returns (bytes, media type, encode time in ms).
+    """
+    media_type, ext, params = FORMATS[fmt]
+    start = time.perf_counter()
+    ok, buf = cv2.imencode(ext, cv2.cvtColor(output, cv2.COLOR_RGB2BGR), params)
+    if not ok:
+        raise RuntimeError(f"Could not encode output as {fmt}")
+    return buf.tobytes(), media_type, (time.perf_counter() - start) * 1000
@@ -0,0 +1,138 @@
+"""
+Compiled inference engine for the Generator and Discriminator.
+
+Every BatchNorm is folded into the convolution in front of it, then the
+model is served through TorchScript ("script") or torch.compile
+("compile"). Dropout can be kept stochastic for MC-dropout sampling.
+
+Run directly to check the compiled models against eager mode:
+    python engine.py --engine script --gen finalObjectGen.pth --disc finalObjectDisc.pth.tar
+"""
+import argparse
+import copy
+import time
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+from checkpoints import load_model
+from deepGenerator import DeepBlock, Generator
+from discriminator import Discriminator
+
+ENGINES = ("eager", "script", "compile")
+
+
+# -------------------------
+# BatchNorm Folding
+# -------------------------
+def fold_batchnorm(model):
+    """
+    Return an eval-mode copy of model with each BatchNorm folded into the
+    preceding conv: DeepBlock.conv1/bn1 and conv2/bn2 (ConvTranspose2d in
+    the decoder), and Conv2d → BatchNorm2d pairs inside nn.Sequential.
+    """
+    model = copy.deepcopy(model).eval()
+
+    for module in model.modules():
+        if isinstance(module, DeepBlock):
+            module.conv1 = fuse_conv_bn_eval(module.conv1, module.bn1, transpose=not module.down)
+            module.conv2 = fuse_conv_bn_eval(module.conv2, module.bn2)
+            module.bn1 = nn.Identity()
+            module.bn2 = nn.Identity()
+        elif isinstance(module, nn.Sequential):
+            for i in range(len(module) - 1):
+                conv, bn = module[i], module[i + 1]
+                if isinstance(conv, (nn.Conv2d, nn.ConvTranspose2d)) and isinstance(bn, nn.BatchNorm2d):
+                    module[i] = fuse_conv_bn_eval(conv, bn, transpose=isinstance(conv, nn.ConvTranspose2d))
+                    module[i + 1] = nn.Identity()
+
+    return model
+
+
+def set_dropout(model, enabled):
+    """Switch dropout layers on (stochastic) or off, leaving everything else in eval mode."""
+    for module in model.modules():
+        if isinstance(module, nn.Dropout):
+            module.train(enabled)
+    return model
+
+
+# -------------------------
+# Engine Builder
+# -------------------------
+def build_engine(model, engine="script", dropout=False):
+    """
+    Fold BatchNorm and compile model for inference.
+    engine = "eager" | "script" | "compile"
+    dropout = keep dropout stochastic at inference time
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown inference engine {engine!r}, expected one of {ENGINES}")
+
+    model = set_dropout(fold_batchnorm(model), dropout)
+
+    if engine == "script":
+        scripted = torch.jit.script(model)
+        if dropout:
+            return scripted
+        # Freezing inlines weights and drops the (now unused) training branches
+        return torch.jit.optimize_for_inference(torch.jit.freeze(scripted))
+    if engine == "compile":
+        return torch.compile(model)
+    return model
+
+
+def check_equivalence(eager, compiled, *inputs, atol=1e-4):
+    """
+    Compare a compiled model against its eager original on the same inputs.
+    Both must be deterministic (dropout off). Returns the max absolute error
+    and raises if it exceeds atol.
+    """
+    with torch.no_grad():
+        expected = eager(*inputs)
+        actual = compiled(*inputs)
+    error = (expected - actual).abs().max().item()
+    if error > atol:
+        raise RuntimeError(f"Compiled model deviates from eager mode (max abs error {error:.2e} > {atol:.0e})")
+    return error
+
+
+def _latency(model, *inputs, repeat=10):
+    with torch.no_grad():
+        model(*inputs)  # warmup / compilation
+        start = time.perf_counter()
+        for _ in range(repeat):
+            model(*inputs)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a compiled engine against eager mode.")
+    parser.add_argument("--engine", choices=ENGINES[1:], default="script")
+    parser.add_argument("--gen", help="generator checkpoint (random weights if omitted)")
+    parser.add_argument("--disc", help="discriminator checkpoint (random weights if omitted)")
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    cpu = torch.device("cpu")
+    gen = load_model(Generator, args.gen, cpu) if args.gen else Generator()
+    disc = load_model(lambda: Discriminator(in_channels=3), args.disc, cpu) if args.disc else Discriminator(in_channels=3)
+    gen.eval()
+    disc.eval()
+
+    x = torch.randn(args.batch_size, 3, 256, 256)
+    y = torch.randn(args.batch_size, 3, 256, 256)
+
+    for name, eager, inputs in [("Generator", gen, (x,)), ("Discriminator", disc, (x, y))]:
+        compiled = build_engine(eager, args.engine)
+        error = check_equivalence(eager, compiled, *inputs)
+        eager_ms = _latency(eager, *inputs, repeat=args.repeat)
+        compiled_ms = _latency(compiled, *inputs, repeat=args.repeat)
+        print(
+            f"{name}: max abs error {error:.2e} | eager {eager_ms:.1f} ms | "
+            f"{args.engine} {compiled_ms:.1f} ms | batch {args.batch_size}"
+        )
+
+
+if __name__ == "__main__":
+    main()
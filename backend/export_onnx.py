@@ -0,0 +1,84 @@
+"""
+Export the serving Generator/Discriminator checkpoints to ONNX with a
+dynamic batch axis, then check ONNX Runtime against PyTorch.
+
+Usage:
+    python export_onnx.py                      # every model_type served
+    python export_onnx.py --gen G.pth --disc D.pth.tar
+Each model is written next to its checkpoint (finalObjectGen.pth →
+finalObjectGen.onnx), which is where INFERENCE_ENGINE=onnx looks for it.
+"""
+import argparse
+import torch
+from checkpoints import load_model
+from deepGenerator import Generator
+from discriminator import Discriminator
+from onnx_backend import OnnxModel, onnx_path
+import settings
+
+OPSET = 17
+
+
+def load(factory, checkpoint):
+    return load_model(factory, checkpoint, torch.device("cpu")).eval()
+
+
+def export(model, inputs, input_names, path):
+    dynamic_axes = {name: {0: "batch"} for name in input_names + ["output"]}
+    torch.onnx.export(
+        model,
+        inputs,
+        path,
+        input_names=input_names,
+        output_names=["output"],
+        dynamic_axes=dynamic_axes,
+        opset_version=OPSET,
+        dynamo=False,
+    )
+
+
+def verify(model, path, inputs, atol=1e-4):
+    """Max abs error of ONNX Runtime against PyTorch on the given inputs."""
+    with torch.no_grad():
+        expected = model(*inputs)
+    actual = OnnxModel(path)(*inputs)
+    error = (expected - actual).abs().max().item()
+    if error > atol:
+        raise RuntimeError(f"{path}: ONNX output deviates from PyTorch (max abs error {error:.2e})")
+    return error
+
+
+def export_pair(gen_checkpoint, disc_checkpoint):
+    gen = load(Generator, gen_checkpoint)
+    disc = load(lambda: Discriminator(in_channels=3), disc_checkpoint)
+
+    x = torch.randn(1, 3, 256, 256)
+    export(gen, (x,), ["input"], onnx_path(gen_checkpoint))
+    export(disc, (x, x), ["input", "candidate"], onnx_path(disc_checkpoint))
+
+    # Check at a different batch size than the export to exercise the dynamic axis
+    xb = torch.randn(4, 3, 256, 256)
+    for model, checkpoint, inputs in [(gen, gen_checkpoint, (xb,)), (disc, disc_checkpoint, (xb, xb))]:
+        error = verify(model, onnx_path(checkpoint), inputs)
+        print(f"{checkpoint} → {onnx_path(checkpoint)} (max abs error {error:.2e})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gen", help="generator checkpoint")
+    parser.add_argument("--disc", help="discriminator checkpoint")
+    args = parser.parse_args()
+
+    if args.gen or args.disc:
+        if not (args.gen and args.disc):
+            parser.error("--gen and --disc must be given together")
+        pairs = [(args.gen, args.disc)]
+    else:
+        pairs = list(settings.CHECKPOINTS.values())
+
+    for gen_checkpoint, disc_checkpoint in pairs:
+        export_pair(gen_checkpoint, disc_checkpoint)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Load test for the FastAPI service (main.app).
+
+Each configuration is a set of environment overrides (see settings.py).
+For every one, a fresh uvicorn server is started in a subprocess and
+warmed up, then --concurrency clients send a mix of object / scene
+uploads for --duration seconds. The report gives throughput and p50 /
+p95 / p99 latency, overall and per model type, and the server's memory
+(the process and its inference workers) sampled over the run.
+
+Missing checkpoints are replaced by random-weight stand-ins, so the
+harness runs on a fresh clone; latencies are the same as with trained
+weights, only the images are noise.
+
+Usage:
+    python loadtest.py
+    python loadtest.py --concurrency 8 --duration 60 --mix 0.7 \\
+        --config "" --config "NUM_SAMPLES=1" --config "MAX_BATCH_SIZE=1" \\
+        --config "SERVE_WORKERS=2" --json loadtest.json
+Without --config, the default sample count, batching and thread count
+comparisons below are run. Memory is read from /proc (Linux only).
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import cv2
+import httpx
+import numpy as np
+from safetensors.torch import save_file
+import settings
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Compared when no --config is given: the defaults, one sample instead of
+# best-of-N, batching off, and half the threads
+DEFAULT_CONFIGS = [
+    "",
+    "NUM_SAMPLES=1",
+    "MAX_BATCH_SIZE=1",
+    f"OMP_NUM_THREADS={max(1, (os.cpu_count() or 2) // 2)}",
+]
+
+
+def parse_config(spec):
+    """"NUM_SAMPLES=1 MAX_BATCH_SIZE=1" → {"NUM_SAMPLES": "1", "MAX_BATCH_SIZE": "1"}"""
+    env = {}
+    for pair in spec.replace(",", " ").split():
+        key, _, value = pair.partition("=")
+        env[key] = value
+    return env
+
+
+# -------------------------
+# Stand-in Models
+# -------------------------
+def stand_in_checkpoints(workdir):
+    """
+    Environment pointing every missing checkpoint at random weights saved
+    as .safetensors in workdir.
+    """
+    import torch
+    from deepGenerator import Generator
+    from discriminator import Discriminator
+
+    env = {}
+    for model_type, (gen_path, disc_path) in settings.CHECKPOINTS.items():
+        prefix = model_type.upper()
+        for kind, path, factory in [
+            ("GEN", gen_path, Generator),
+            ("DISC", disc_path, lambda: Discriminator(in_channels=3)),
+        ]:
+            if os.path.exists(os.path.join(BACKEND_DIR, path)):
+                continue
+            torch.manual_seed(0)
+            stand_in = os.path.join(workdir, f"{model_type}_{kind.lower()}.safetensors")
+            save_file({k: v.contiguous() for k, v in factory().state_dict().items()}, stand_in)
+            env[f"{prefix}_{kind}_CHECKPOINT"] = stand_in
+            print(f"{path} not found, using random weights")
+    return env
+
+
+def synthetic_upload(rng, width=640, height=480):
+    """A PNG of random strokes on paper, different for every call."""
+    img = np.full((height, width, 3), 235, np.uint8)
+    for _ in range(rng.randint(10, 40)):
+        p1 = (rng.randrange(width), rng.randrange(height))
+        p2 = (rng.randrange(width), rng.randrange(height))
+        color = tuple(rng.randrange(256) for _ in range(3))
+        cv2.line(img, p1, p2, color, rng.randint(1, 5))
+    ok, buf = cv2.imencode(".png", img)
+    return buf.tobytes()
+
+
+# -------------------------
+# Server
+# -------------------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_tree_rss(pid):
+    """Resident memory in bytes of pid and all its descendants, or None without /proc."""
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+            for children in glob.glob(f"/proc/{p}/task/*/children"):
+                with open(children) as f:
+                    stack += [int(c) for c in f.read().split()]
+        except OSError:
+            if p == pid:
+                return None
+    return total
+
+
+def start_server(env, port, log):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with code {server.returncode}, see {log.name}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/models", timeout=1).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    server.kill()
+    raise RuntimeError(f"server did not start within 300s, see {log.name}")
+
+
+def stop_server(server):
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+# -------------------------
+# Load
+# -------------------------
+async def run_load(base_url, uploads, args, server_pid):
+    """Closed loop: each of --concurrency clients sends its next request as soon as one returns."""
+    rng = random.Random(args.seed)
+    results = []
+    memory = []
+    started = time.perf_counter()
+    deadline = started + args.duration
+
+    async def client(c):
+        while time.perf_counter() < deadline:
+            model_type = "object" if rng.random() < args.mix else "scene"
+            upload = uploads[rng.randrange(len(uploads))]
+            start = time.perf_counter()
+            try:
+                r = await c.post(
+                    "/generate",
+                    params={"model_type": model_type, "seed": rng.randrange(2**31)},
+                    files={"file": ("sketch.png", upload, "image/png")},
+                )
+                ok = r.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            results.append((model_type, start - started, time.perf_counter() - start, ok))
+
+    async def sample_memory():
+        while time.perf_counter() < deadline:
+            memory.append((time.perf_counter() - started, process_tree_rss(server_pid)))
+            await asyncio.sleep(args.sample_interval)
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=600, limits=limits) as c:
+        sampler = asyncio.create_task(sample_memory())
+        await asyncio.gather(*[client(c) for _ in range(args.concurrency)])
+        sampler.cancel()
+    return results, memory, time.perf_counter() - started
+
+
+async def warmup(base_url, uploads, requests):
+    async with httpx.AsyncClient(base_url=base_url, timeout=600) as c:
+        for i in range(requests):
+            for model_type in settings.CHECKPOINTS:
+                await c.post(
+                    "/generate",
+                    params={"model_type": model_type},
+                    files={"file": ("sketch.png", uploads[i % len(uploads)], "image/png")},
+                )
+
+
+def latency_stats(latencies):
+    if not latencies:
+        return {"requests": 0}
+    ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"requests": len(ms), "mean_ms": ms.mean(), "p50_ms": p50, "p95_ms": p95, "p99_ms": p99}
+
+
+def summarize(spec, results, memory, seconds):
+    ok = [r for r in results if r[3]]
+    rss = [b for _, b in memory if b is not None]
+    return {
+        "config": spec or "(defaults)",
+        "seconds": seconds,
+        "errors": len(results) - len(ok),
+        "throughput_rps": len(ok) / seconds,
+        "latency": latency_stats([r[2] for r in ok]),
+        "by_model_type": {
+            model_type: latency_stats([r[2] for r in ok if r[0] == model_type])
+            for model_type in settings.CHECKPOINTS
+        },
+        "peak_rss_mb": max(rss) / 2**20 if rss else None,
+        "mean_rss_mb": sum(rss) / len(rss) / 2**20 if rss else None,
+        "memory_timeline": [(round(t, 2), b) for t, b in memory],
+        "requests": results,
+    }
+
+
+def print_report(summaries):
+    print(
+        f"\n{'config':<32}{'req/s':>8}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        f"{'peak MiB':>10}{'mean MiB':>10}"
+    )
+    for s in summaries:
+        lat = s["latency"]
+        mem = lambda v: f"{v:>10.0f}" if v is not None else f"{'n/a':>10}"
+        print(
+            f"{s['config']:<32}{s['throughput_rps']:>8.2f}{s['errors']:>8}"
+            f"{lat.get('p50_ms', 0):>9.0f}{lat.get('p95_ms', 0):>9.0f}{lat.get('p99_ms', 0):>9.0f}"
+            f"{mem(s['peak_rss_mb'])}{mem(s['mean_rss_mb'])}"
+        )
+        for model_type, m in s["by_model_type"].items():
+            if m["requests"]:
+                print(
+                    f"  {model_type:<30}{m['requests']:>8} req{m['p50_ms']:>12.0f}"
+                    f"{m['p95_ms']:>9.0f}{m['p99_ms']:>9.0f}"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", action="append", help='environment overrides, e.g. "NUM_SAMPLES=1 MAX_BATCH_SIZE=1"')
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load per config")
+    parser.add_argument("--mix", type=float, default=0.5, help="fraction of object uploads (the rest are scene)")
+    parser.add_argument("--uploads", type=int, default=32, help="distinct synthetic uploads to cycle through")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed requests per model type")
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="seconds between memory samples")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write every request and memory sample here")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    uploads = [synthetic_upload(rng) for _ in range(args.uploads)]
+
+    summaries = []
+    with tempfile.TemporaryDirectory() as workdir:
+        base_env = {
+            **os.environ,
+            **stand_in_checkpoints(workdir),
+            # Every model loaded before the clock starts, nothing served from the cache
+            "PRELOAD_MODELS": ",".join(settings.CHECKPOINTS),
+            "CACHE_MAX_ENTRIES": "0",
+            "CACHE_DIR": "",
+        }
+
+        for spec in args.config or DEFAULT_CONFIGS:
+            port = free_port()
+            print(f"=> {spec or '(defaults)'}: starting server on port {port}")
+            with open(os.path.join(workdir, f"server_{port}.log"), "w+") as log:
+                try:
+                    server = start_server({**base_env, **parse_config(spec)}, port, log)
+                except RuntimeError:
+                    log.seek(0)
+                    print(log.read()[-2000:])
+                    raise
+                try:
+                    base_url = f"http://127.0.0.1:{port}"
+                    asyncio.run(warmup(base_url, uploads, args.warmup))
+                    results, memory, seconds = asyncio.run(run_load(base_url, uploads, args, server.pid))
+                finally:
+                    stop_server(server)
+
+            summary = summarize(spec, results, memory, seconds)
+            summaries.append(summary)
+            print(
+                f"   {summary['latency']['requests']} requests, {summary['throughput_rps']:.2f} req/s, "
+                f"p95 {summary['latency'].get('p95_ms', 0):.0f} ms"
+            )
+
+    print_report(summaries)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summaries, f, indent=2, default=float)
+        print(f"\n=> Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
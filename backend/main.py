@@ -1,13 +1,47 @@
-from fastapi import FastAPI, UploadFile, File, Query
-from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Query, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from deepGenerator import Generator
 from discriminator import Discriminator
-from apiUtils import process_and_generate
+from apiUtils import SEED_RANGE, candidate_seeds, content_seed, install_seeded_dropout, preprocess, generate_batch, sample_candidate, tensor_to_array
+from batcher import MicroBatcher
+from registry import ModelRegistry
+from workers import WorkerPool
+from cache import ResultCache, checkpoint_id
+from checkpoints import derived_path, load_model
+from engine import build_engine, check_equivalence, set_dropout
+from tiling import preprocess_tiled, tiled_generate
+from encoding import FORMATS, encode_image, negotiate
+from metrics import Counter, Gauge, Histogram, StageTimer, Timed, render as render_metrics
+from profiling import profile_pair
+import settings
 import torch
-import io
+import base64
+import copy
+import json
+import time
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app):
+    global pool
+
+    # Warmup hook
+    await run_in_threadpool(registry.preload, settings.PRELOAD_MODELS)
+
+    if settings.SERVE_WORKERS > 0:
+        pool = await run_in_threadpool(start_pool)
+
+    yield
+
+    await batcher.close()
+    if pool is not None:
+        pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -16,57 +50,439 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Readable by the frontend's cross-origin fetch (X-Seed re-renders a result)
+    expose_headers=["X-Seed", "X-Cache", "X-Samples-Used", "Server-Timing"],
 )
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-# Load object models
-object_gen = Generator().to(device)
-object_disc = Discriminator(in_channels=3).to(device)
+# ?format= values accepted by the image endpoints
+FORMAT_PATTERN = f"^({'|'.join(FORMATS)})$"
+
+# The exported ONNX graphs have no dropout left to sample from, so seeds
+# would be accepted and silently ignored
+if settings.INFERENCE_ENGINE == "onnx" and settings.STOCHASTIC_DROPOUT:
+    raise RuntimeError("STOCHASTIC_DROPOUT=1 needs a PyTorch engine, it has no effect with INFERENCE_ENGINE=onnx")
+# Nor do the int8 models: Train/quantize.py quantizes Train's Generator,
+# which is built without dropout
+if settings.QUANTIZED_MODELS and settings.STOCHASTIC_DROPOUT:
+    raise RuntimeError("STOCHASTIC_DROPOUT=1 has no effect on the int8 models, unset QUANTIZED_MODELS or STOCHASTIC_DROPOUT")
+
+if settings.DETERMINISTIC:
+    torch.backends.cudnn.benchmark = False
+    torch.backends.cudnn.deterministic = True
+    torch.use_deterministic_algorithms(True, warn_only=True)
+
+
+def load_models(model_type):
+    """Load the generator/discriminator pair for model_type, ready for inference."""
+    gen_path, disc_path = settings.CHECKPOINTS[model_type]
+
+    if model_type in settings.QUANTIZED_MODELS:
+        return load_quantized_pair(gen_path, disc_path)
+
+    if settings.INFERENCE_ENGINE == "onnx":
+        # Optional dependency, only needed for this engine
+        from onnx_backend import load_onnx_pair
+        return load_onnx_pair(gen_path, disc_path, settings.ONNX_THREADS)
+
+    # .pth / .pth.tar training checkpoints or mmapped .safetensors
+    gen = load_model(Generator, gen_path, device)
+    disc = load_model(lambda: Discriminator(in_channels=3), disc_path, device)
+
+    gen.eval()
+    disc.eval()
+
+    if settings.INFERENCE_ENGINE != "eager":
+        return compile_pair(gen, disc)
+
+    # Per-candidate seeded masks (seeded_sampling), hooked once here
+    return install_seeded_dropout(set_dropout(gen, settings.STOCHASTIC_DROPOUT)), disc
+
+
+def load_quantized_pair(gen_path, disc_path):
+    """Load the int8 TorchScript models written by Train/quantize.py (CPU only)."""
+    if device.type != "cpu":
+        raise RuntimeError("Quantized models only run on CPU, unset QUANTIZED_MODELS to serve on GPU")
+    return tuple(
+        torch.jit.load(derived_path(path, ".int8.pt"), map_location=device).eval()
+        for path in (gen_path, disc_path)
+    )
+
+
+def compile_pair(gen, disc):
+    """Fold BatchNorm, compile both models and check them against eager mode."""
+    x = torch.randn(1, 3, 256, 256, device=device)
+
+    compiled_gen = build_engine(gen, settings.INFERENCE_ENGINE, dropout=settings.STOCHASTIC_DROPOUT)
+    compiled_disc = build_engine(disc, settings.INFERENCE_ENGINE)
+
+    if not settings.STOCHASTIC_DROPOUT:
+        check_equivalence(gen, compiled_gen, x)
+    check_equivalence(disc, compiled_disc, x, x)
+
+    return compiled_gen, compiled_disc
+
+
+# Pairs are loaded on first use (or by the PRELOAD_MODELS warmup) and
+# evicted when idle or over the memory budget
+registry = ModelRegistry(
+    load_models,
+    memory_budget_mb=settings.MODEL_MEMORY_BUDGET_MB,
+    idle_seconds=settings.MODEL_IDLE_SECONDS,
+    identify=lambda model_type: checkpoint_id(*served_files(model_type)),
+)
+
+
+def serving_backend(model_type):
+    """"int8", "onnx" or the PyTorch engine that runs model_type."""
+    if model_type in settings.QUANTIZED_MODELS:
+        return "int8"
+    return settings.INFERENCE_ENGINE
+
+
+def served_files(model_type):
+    """The files load_models reads for model_type: the checkpoints or the models derived from them."""
+    paths = settings.CHECKPOINTS[model_type]
+    backend = serving_backend(model_type)
+    if backend == "int8":
+        return [derived_path(path, ".int8.pt") for path in paths]
+    if backend == "onnx":
+        return [derived_path(path, ".onnx") for path in paths]
+    return list(paths)
+
+
+def model_id(model_type):
+    """Identifies the weights and the way they are served, for the result cache."""
+    return (
+        f"{registry.model_id(model_type)}:{serving_backend(model_type)}:{settings.STOCHASTIC_DROPOUT}"
+        f":{settings.SCORE_THRESHOLD}:{settings.MIN_SCORE_GAIN}:{settings.DETERMINISTIC}"
+    )
+
+
+def request_seed(seed, image_bytes):
+    """?seed= if given, else the SEED setting, else derived from the upload."""
+    if seed is not None:
+        return seed
+    if settings.SEED is not None:
+        return settings.SEED
+    return content_seed(image_bytes)
+
+
+def run_batch(key, inputs, seeds):
+    """
+    Best-of-N generation for a batch of inputs with the same
+    key = (model_type, num_samples); runs on an inference thread.
+    Returns an (output, samples used, chosen seed) tuple per input.
+    """
+    model_type, num_samples = key
+    timer = StageTimer(model_type)
+
+    if pool is not None:
+        with timer.span("inference"):
+            outputs, used, chosen = pool.run_batch(model_type, num_samples, inputs, seeds)
+    else:
+        gen, disc = registry.get(model_type)
+        with timer.span("inference"):
+            outputs, used, chosen = generate_batch(
+                inputs.to(device),
+                Timed(gen, timer, "generator"),
+                Timed(disc, timer, "discriminator"),
+                num_samples, seeds,
+                settings.SCORE_THRESHOLD, settings.MIN_SCORE_GAIN, settings.DETERMINISTIC,
+            )
+        # Everything in best-of-N outside the two networks: repeat, score, argmax, gather
+        passes = timer.spans.get("generator", 0.0) + timer.spans.get("discriminator", 0.0)
+        timer.add("select", max(timer.spans["inference"] - passes, 0.0))
+
+    timer.observe()
+    BATCH_SIZE.observe(len(inputs), model_type=model_type)
+    return list(zip(outputs.cpu(), used.tolist(), chosen))
+
+
+# Multi-process serving (SERVE_WORKERS > 0), started by the lifespan hook
+pool = None
+
+
+def start_pool():
+    """Load every model pair once, in shared memory, and start the worker processes."""
+    if device.type != "cpu" or settings.INFERENCE_ENGINE != "eager" or settings.QUANTIZED_MODELS:
+        raise RuntimeError("SERVE_WORKERS needs eager-mode models on CPU")
+
+    models = {t: registry.get(t) for t in settings.CHECKPOINTS}
+    return WorkerPool(
+        models,
+        num_workers=settings.SERVE_WORKERS,
+        threads_per_worker=settings.THREADS_PER_WORKER,
+        threshold=settings.SCORE_THRESHOLD,
+        min_gain=settings.MIN_SCORE_GAIN,
+        deterministic=settings.DETERMINISTIC,
+    )
+
+
+batcher = MicroBatcher(
+    run_batch,
+    max_batch_size=settings.MAX_BATCH_SIZE,
+    max_wait_ms=settings.MAX_WAIT_MS,
+    # One batch in flight per worker process
+    concurrency=max(1, settings.SERVE_WORKERS),
+)
+
+cache = ResultCache(
+    max_entries=settings.CACHE_MAX_ENTRIES,
+    max_bytes=settings.CACHE_MAX_MB * 1024 * 1024,
+    disk_dir=settings.CACHE_DIR,
+    disk_max_bytes=settings.CACHE_DISK_MAX_MB * 1024 * 1024,
+)
+
+# -------------------------
+# Metrics (GET /metrics)
+# -------------------------
+# Per-stage spans go to metrics.STAGE_SECONDS: read, cache, decode,
+# preprocess, to_tensor, batch (queue wait + inference), to_array and
+# encode per /generate request; inference, generator, discriminator and
+# select per batch
+REQUEST_SECONDS = Histogram(
+    "doodle_request_seconds", "End-to-end request latency.", ("endpoint", "model_type")
+)
+REQUESTS = Counter("doodle_requests_total", "Completed /generate requests.", ("model_type", "cache"))
+BATCH_SIZE = Histogram(
+    "doodle_batch_size", "Requests per inference batch.", ("model_type",), buckets=(1, 2, 4, 8, 16, 32)
+)
+IN_FLIGHT = Gauge("doodle_requests_in_flight", "Requests being handled.", ("endpoint", "model_type"))
+Gauge(
+    "doodle_queue_depth",
+    "Requests waiting for an inference batch.",
+    ("model_type",),
+    callback=lambda: queue_depths(),
+)
 
-# Load scene models
-scene_gen = Generator().to(device)
-scene_disc = Discriminator(in_channels=3).to(device)
 
-object_gen.load_state_dict(torch.load("finalObjectGen.pth", map_location=device)["state_dict"])
-object_disc.load_state_dict(torch.load("finalObjectDisc.pth.tar", map_location=device)["state_dict"])
+def queue_depths():
+    """Batcher queue depths summed per model_type (queues are per model_type and num_samples)."""
+    depths = {}
+    for (model_type, _), depth in batcher.queue_depths().items():
+        depths[(model_type,)] = depths.get((model_type,), 0) + depth
+    return depths
 
-scene_gen.load_state_dict(torch.load("SceneGen.pth.tar", map_location=device)["state_dict"])
-scene_disc.load_state_dict(torch.load("SceneDisc.pth.tar", map_location=device)["state_dict"])
 
-object_gen.eval()
-object_disc.eval()
-scene_gen.eval()
-scene_disc.eval()
+Gauge("doodle_batches_in_flight", "Inference batches running.", callback=lambda: batcher.in_flight())
+Gauge("doodle_model_resident_bytes", "Memory held by loaded model pairs.", callback=lambda: registry.resident_bytes())
 
 
 @app.post("/generate")
 async def generate_image(
     file: UploadFile = File(...),
-    model_type: str = Query(..., enum=["object", "scene"])
+    model_type: str = Query(..., enum=["object", "scene"]),
+    format: str = Query(None, pattern=FORMAT_PATTERN),
+    accept: str = Header(None),
+    seed: int = Query(None, ge=0, lt=SEED_RANGE),
+    num_samples: int = Query(settings.NUM_SAMPLES, ge=1, le=16),
 ):
-
+    """
+    Best-of-num_samples generation. Candidate k is drawn with seed + k;
+    the X-Seed header holds the seed of the returned one, so
+    ?seed=<X-Seed>&num_samples=1 renders it again.
+    """
     print("Received request for model type:", model_type)
+    timer = StageTimer(model_type)
+    start = time.perf_counter()
+
+    with IN_FLIGHT.track(endpoint="generate", model_type=model_type):
+        with timer.span("read"):
+            image_bytes = await file.read()
+        seed = request_seed(seed, image_bytes)
+
+        key = ResultCache.make_key(image_bytes, model_type, num_samples, model_id(model_type), seed)
+        with timer.span("cache"):
+            entry = await run_in_threadpool(cache.get, key)
+        cache_status = "HIT" if entry is not None else "MISS"
+        samples_used = 0
+
+        if entry is not None:
+            output, meta = entry
+            chosen_seed = meta.get("seed", seed)
+        else:
+            input_tensor = await run_in_threadpool(preprocess, image_bytes, model_type, timer)
+
+            # Grouped with concurrent requests for the same model_type
+            with timer.span("batch"):
+                best_fake, samples_used, chosen_seed = await batcher.submit(
+                    (model_type, num_samples), input_tensor, seed
+                )
+
+            with timer.span("to_array"):
+                output = tensor_to_array(best_fake)
+            await run_in_threadpool(cache.put, key, output, {"seed": chosen_seed})
+
+        content, media_type, encode_ms = await run_in_threadpool(encode_image, output, negotiate(accept, format))
+        timer.add("encode", encode_ms / 1000)
+
+    timer.observe()
+    REQUESTS.inc(model_type=model_type, cache=cache_status)
+    REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="generate", model_type=model_type)
+
+    return Response(
+        content,
+        media_type=media_type,
+        headers={
+            "X-Cache": cache_status,
+            "X-Samples-Used": str(samples_used),
+            "X-Seed": str(chosen_seed),
+            "Server-Timing": timer.server_timing(),
+            "Vary": "Accept",
+        },
+    )
+
+
+@app.post("/generate/stream")
+async def generate_stream(
+    file: UploadFile = File(...),
+    model_type: str = Query(..., enum=["object", "scene"]),
+    num_samples: int = Query(settings.NUM_SAMPLES, ge=1, le=16),
+    seed: int = Query(None, ge=0, lt=SEED_RANGE),
+):
+    """
+    Server-sent events: a "candidate" event with its discriminator score as
+    soon as each sample is generated, then a final "best" event. Stops
+    early under the adaptive sampling settings. Candidates are seeded like
+    /generate, so each event's seed renders it again there.
+    """
+    print("Received streaming request for model type:", model_type)
     image_bytes = await file.read()
+    seed = request_seed(seed, image_bytes)
 
-    # Select appropriate model
-    if model_type == "object":
-        gen = object_gen
-        disc = object_disc
-    else:
-        gen = scene_gen
-        disc = scene_disc
-
-    output_pil = process_and_generate(
-        image_bytes,
-        gen,
-        disc,
-        model_type=model_type,
-        num_samples=5
+    async def events():
+        with IN_FLIGHT.track(endpoint="stream", model_type=model_type):
+            async for event in candidate_events():
+                yield event
+
+    async def candidate_events():
+        input_tensor = await run_in_threadpool(preprocess, image_bytes, model_type)
+        gen, disc = await run_in_threadpool(registry.get, model_type)
+        input_tensor = input_tensor.to(device)
+
+        best = None
+        for index, candidate_seed in enumerate(candidate_seeds(seed, num_samples)):
+            fake, score = await run_in_threadpool(sample_candidate, input_tensor, gen, disc, candidate_seed)
+            candidate = {
+                "index": index,
+                "seed": candidate_seed,
+                "score": score,
+                "image": await run_in_threadpool(encode_data_url, tensor_to_array(fake)),
+            }
+            gain = score - best["score"] if best is not None else float("inf")
+            if gain > 0:
+                best = candidate
+            yield sse_event("candidate", candidate)
+
+            # Same early exit as adaptive sampling on /generate
+            threshold, min_gain = settings.SCORE_THRESHOLD, settings.MIN_SCORE_GAIN
+            if threshold is not None and best["score"] >= threshold:
+                break
+            if min_gain is not None and index > 0 and gain < min_gain:
+                break
+
+        yield sse_event("best", best)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
-    img_bytes = io.BytesIO()
-    output_pil.save(img_bytes, format="PNG")
-    img_bytes.seek(0)
 
-    return StreamingResponse(img_bytes, media_type="image/png")
+@app.post("/generate/tiled")
+async def generate_tiled(
+    file: UploadFile = File(...),
+    model_type: str = Query(..., enum=["object", "scene"]),
+    format: str = Query(None, pattern=FORMAT_PATTERN),
+    accept: str = Header(None),
+):
+    """Full-resolution generation over blended 256x256 tiles."""
+    print("Received tiled request for model type:", model_type)
+    start = time.perf_counter()
+
+    with IN_FLIGHT.track(endpoint="tiled", model_type=model_type):
+        image_bytes = await file.read()
+
+        input_tensor = await run_in_threadpool(preprocess_tiled, image_bytes, settings.TILE_MAX_SIDE)
+        gen, disc = await run_in_threadpool(registry.get, model_type)
+
+        output = await run_in_threadpool(
+            tiled_generate,
+            input_tensor.to(device),
+            gen,
+            disc,
+            settings.TILE_OVERLAP,
+            settings.TILE_BATCH_SIZE,
+            settings.TILE_SAMPLES,
+        )
+        content, media_type, encode_ms = await run_in_threadpool(encode_image, output, negotiate(accept, format))
+
+    REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="tiled", model_type=model_type)
+
+    return Response(
+        content,
+        media_type=media_type,
+        headers={"Server-Timing": f"encode;dur={encode_ms:.2f}", "Vary": "Accept"},
+    )
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of the latency histograms, queue depths and in-flight counts."""
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/profile")
+async def profile_models(
+    model_type: str = Query(..., enum=["object", "scene"]),
+    batch_size: int = Query(1, ge=1, le=32),
+    repeat: int = Query(3, ge=1, le=20),
+    trace: bool = False,
+):
+    """
+    Per-block wall time, FLOPs, activation memory and output shape of the
+    served models on random input, or Chrome traces with trace=true.
+    Enabled by PROFILING=1.
+    """
+    if not settings.PROFILING:
+        raise HTTPException(status_code=404, detail="Profiling is disabled, set PROFILING=1")
+
+    gen, disc = await run_in_threadpool(registry.get, model_type)
+    if not all(isinstance(m, torch.nn.Module) and not isinstance(m, torch.jit.ScriptModule) for m in (gen, disc)):
+        raise HTTPException(status_code=400, detail="Layer profiling needs eager-mode models")
+
+    # Hooks go on private copies so concurrent requests are neither recorded nor slowed down
+    gen_prof, disc_prof = await run_in_threadpool(
+        lambda: profile_pair(copy.deepcopy(gen), copy.deepcopy(disc), batch_size, repeat)
+    )
+
+    if trace:
+        return {"generator": gen_prof.chrome_trace(), "discriminator": disc_prof.chrome_trace()}
+    return {"generator": gen_prof.summary(), "discriminator": disc_prof.summary()}
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return cache.stats()
+
+
+@app.get("/models")
+async def model_stats():
+    """Load times, resident sizes and idle times of the model pairs."""
+    return {
+        "resident_bytes": registry.resident_bytes(),
+        "memory_budget_bytes": registry.memory_budget,
+        "models": registry.info(),
+    }
+
+
+def encode_data_url(output):
+    content, media_type, _ = encode_image(output, "png")
+    return f"data:{media_type};base64," + base64.b64encode(content).decode()
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
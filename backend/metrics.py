@@ -0,0 +1,218 @@
+"""
+Request instrumentation in Prometheus text format, without a client library.
+
+A StageTimer collects the spans of one request (or one inference batch):
+    timer = StageTimer("scene")
+    with timer.span("decode"):
+        ...
+    timer.observe()  # into STAGE_SECONDS{stage, model_type}
+
+render() produces the /metrics body. Gauges are read through callbacks at
+scrape time, so queue depths and in-flight counts are always current.
+"""
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+import torch
+import torch.nn as nn
+
+try:
+    import resource  # not on Windows
+except ImportError:
+    resource = None
+
+# Latency buckets in seconds, from single-digit ms (encode) to whole batches
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, n in zip(self.buckets, counts):
+                    labels = _labels(self.labelnames + ("le",), key + (repr(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {n}")
+                labels = _labels(self.labelnames + ("le",), key + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge:
+    """
+    Either set through inc/dec, or read from callback() at scrape time,
+    which returns {label values tuple: value} (or a number without labels).
+    """
+    def __init__(self, name, help, labelnames=(), callback=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if self.callback is not None:
+            values = self.callback()
+            values = values if isinstance(values, dict) else {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+def render():
+    """All registered metrics in Prometheus text exposition format."""
+    return "\n".join(line for metric in _metrics for line in metric.render()) + "\n"
+
+
+# -------------------------
+# Stage Timing
+# -------------------------
+STAGE_SECONDS = Histogram(
+    "doodle_stage_seconds",
+    "Time spent in each request / inference stage.",
+    ("stage", "model_type"),
+)
+
+
+class StageTimer:
+    """
+    Spans of one request or batch. Repeated spans of the same stage (e.g.
+    several generator passes) add up.
+    """
+    def __init__(self, model_type):
+        self.model_type = model_type
+        self.spans = {}
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage, seconds):
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    def observe(self):
+        for stage, seconds in self.spans.items():
+            STAGE_SECONDS.observe(seconds, stage=stage, model_type=self.model_type)
+
+    def server_timing(self):
+        """Server-Timing header value, durations in ms."""
+        return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in self.spans.items())
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MiB, or None where it is not available (Windows)."""
+    if resource is None:
+        return None
+    # ru_maxrss is in bytes on macOS, KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def span(timer, stage):
+    """timer.span(stage), or nothing when the caller is not being timed."""
+    return timer.span(stage) if timer is not None else nullcontext()
+
+
+class Timed(nn.Module):
+    """
+    Wrap a model so every forward pass is recorded as stage on timer.
+    Works for any callable engine (eager, TorchScript, ONNX, int8). CUDA
+    work is synchronized so the span covers the kernels, not the launch.
+
+    A torch model becomes a submodule, so .modules() still reaches its
+    dropout layers for apiUtils.seeded_sampling to seed per candidate.
+    """
+    def __init__(self, model, timer, stage):
+        super().__init__()
+        self.model = model
+        self.timer = timer
+        self.stage = stage
+
+    def forward(self, *args):
+        with self.timer.span(self.stage):
+            out = self.model(*args)
+            if getattr(out, "is_cuda", False):
+                torch.cuda.synchronize()
+        return out
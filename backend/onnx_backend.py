@@ -0,0 +1,48 @@
+import os
+import numpy as np
+import onnxruntime as ort
+import torch
+from checkpoints import derived_path
+
+
+def onnx_path(checkpoint_path):
+    """finalObjectGen.pth / SceneDisc.pth.tar → finalObjectGen.onnx / SceneDisc.onnx"""
+    return derived_path(checkpoint_path, ".onnx")
+
+
+class OnnxModel:
+    """
+    ONNX Runtime stand-in for a Generator or Discriminator.
+
+    Runs on the CPU execution provider with full graph optimisation and is
+    called exactly like the torch module it replaces: torch tensors in,
+    torch tensors out, so best_of_n works unchanged.
+    """
+    def __init__(self, path, num_threads=0):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads  # 0 = one per physical core
+
+        self.path = path
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def __call__(self, *inputs):
+        feed = {
+            name: x.detach().cpu().numpy().astype(np.float32, copy=False)
+            for name, x in zip(self.input_names, inputs)
+        }
+        (output,) = self.session.run(None, feed)
+        return torch.from_numpy(output)
+
+    def eval(self):
+        return self
+
+
+def load_onnx_pair(gen_checkpoint, disc_checkpoint, num_threads=0):
+    """Load the exported ONNX models that sit next to a pair of .pth checkpoints."""
+    paths = [onnx_path(gen_checkpoint), onnx_path(disc_checkpoint)]
+    for path in paths:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found, export it first with: python export_onnx.py")
+    return tuple(OnnxModel(path, num_threads) for path in paths)
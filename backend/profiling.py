@@ -0,0 +1,258 @@
+"""
+Layer-level profiling for the Generator and Discriminator.
+
+LayerProfiler hooks the top-level blocks of a model (Generator:
+initial_down, down1..down6, bottleneck, up1..up7, final_up;
+Discriminator: initial, model.0..model.3) and records, per call, the wall
+time, FLOPs of the convolutions / linear / BatchNorm layers inside, the
+bytes of the block's output activation and its shape. Time spent between
+blocks (torch.cat of the skip connections) is reported as "(other)".
+
+    with LayerProfiler(gen, "Generator") as prof:
+        gen(x)
+    print(prof.table())
+    prof.chrome_trace("gen_trace.json")  # open in chrome://tracing or Perfetto
+
+It only needs torch, so Train uses it on its own models too: set
+LAYER_PROFILE in Train/config.py (instrument.profile_layers).
+
+Run directly to profile a checkpoint pair:
+    python profiling.py --gen finalObjectGen.pth --disc finalObjectDisc.pth.tar --trace profile
+"""
+import argparse
+import json
+import time
+import torch
+import torch.nn as nn
+
+
+def default_blocks(model):
+    """
+    Direct children of model, with nn.Sequential children expanded one
+    level when they hold composite blocks (Discriminator.model).
+    """
+    blocks = []
+    for name, child in model.named_children():
+        if isinstance(child, nn.Sequential) and any(len(list(c.children())) for c in child):
+            blocks.extend((f"{name}.{i}", c) for i, c in enumerate(child))
+        else:
+            blocks.append((name, child))
+    return blocks
+
+
+def layer_flops(module, inputs, output):
+    """FLOPs (2 per multiply-add) of one leaf layer call, 0 for untracked layer types."""
+    if isinstance(module, nn.Conv2d):
+        kh, kw = module.kernel_size
+        return 2 * output.numel() * (module.in_channels // module.groups) * kh * kw
+    if isinstance(module, nn.ConvTranspose2d):
+        kh, kw = module.kernel_size
+        return 2 * inputs[0].numel() * (module.out_channels // module.groups) * kh * kw
+    if isinstance(module, nn.Linear):
+        return 2 * output.numel() * module.in_features
+    if isinstance(module, nn.BatchNorm2d):
+        return 2 * output.numel()
+    return 0
+
+
+def _tensors(output):
+    if isinstance(output, torch.Tensor):
+        return [output]
+    if isinstance(output, (tuple, list)):
+        return [t for t in output if isinstance(t, torch.Tensor)]
+    return []
+
+
+def _sync(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+class LayerProfiler:
+    """
+    Context manager attaching timing / FLOP hooks to model for the
+    duration of the with block. Every forward pass inside it is recorded;
+    CUDA is synchronized around each block so the times are per block.
+    """
+    def __init__(self, model, name=None, blocks=None):
+        self.model = model
+        self.name = name or type(model).__name__
+        self.blocks = blocks or default_blocks(model)
+        self.records = []  # one per block call
+        self.forwards = []  # (start, end) of each whole forward pass
+        self._handles = []
+        self._current = None
+        self._device = next(model.parameters()).device
+
+    def __enter__(self):
+        self._handles.append(self.model.register_forward_pre_hook(self._forward_start))
+        self._handles.append(self.model.register_forward_hook(self._forward_end))
+
+        for name, block in self.blocks:
+            self._handles.append(block.register_forward_pre_hook(self._block_start(name)))
+            self._handles.append(block.register_forward_hook(self._block_end(name)))
+            for layer in block.modules():
+                if not list(layer.children()):
+                    self._handles.append(layer.register_forward_hook(self._count_flops))
+        return self
+
+    def __exit__(self, *exc):
+        for handle in self._handles:
+            handle.remove()
+        self._handles.clear()
+
+    # -------------------------
+    # Hooks
+    # -------------------------
+    def _forward_start(self, module, inputs):
+        _sync(self._device)
+        self._forward_started = time.perf_counter()
+
+    def _forward_end(self, module, inputs, output):
+        _sync(self._device)
+        self.forwards.append((self._forward_started, time.perf_counter()))
+
+    def _block_start(self, name):
+        def hook(module, inputs):
+            _sync(self._device)
+            self._current = {"name": name, "flops": 0, "start": time.perf_counter()}
+        return hook
+
+    def _block_end(self, name):
+        def hook(module, inputs, output):
+            _sync(self._device)
+            record, self._current = self._current, None
+            record["end"] = time.perf_counter()
+            tensors = _tensors(output)
+            record["activation_bytes"] = sum(t.numel() * t.element_size() for t in tensors)
+            record["shape"] = list(tensors[0].shape) if tensors else None
+            self.records.append(record)
+        return hook
+
+    def _count_flops(self, module, inputs, output):
+        if self._current is not None:
+            self._current["flops"] += layer_flops(module, inputs, output)
+
+    # -------------------------
+    # Reports
+    # -------------------------
+    def summary(self):
+        """Per-block aggregate, in execution order, plus an "(other)" row."""
+        rows = {}
+        for r in self.records:
+            row = rows.setdefault(r["name"], {
+                "name": r["name"], "calls": 0, "total_ms": 0.0, "flops": r["flops"],
+                "activation_bytes": r["activation_bytes"], "shape": r["shape"],
+            })
+            row["calls"] += 1
+            row["total_ms"] += (r["end"] - r["start"]) * 1000
+
+        forward_ms = sum(end - start for start, end in self.forwards) * 1000
+        block_ms = sum(row["total_ms"] for row in rows.values())
+        if self.forwards:
+            rows["(other)"] = {
+                "name": "(other)", "calls": len(self.forwards), "total_ms": max(forward_ms - block_ms, 0.0),
+                "flops": 0, "activation_bytes": 0, "shape": None,
+            }
+
+        total_ms = forward_ms or block_ms or 1.0
+        for row in rows.values():
+            row["mean_ms"] = row["total_ms"] / row["calls"]
+            row["percent"] = 100 * row["total_ms"] / total_ms
+            row["gflops_per_s"] = row["flops"] / (row["mean_ms"] / 1000) / 1e9 if row["mean_ms"] else 0.0
+        return list(rows.values())
+
+    def table(self):
+        """Plain-text table of summary()."""
+        rows = self.summary()
+        lines = [
+            f"{self.name} ({len(self.forwards)} forward passes)",
+            f"{'block':<14}{'calls':>6}{'mean ms':>10}{'%':>7}{'GFLOP':>9}{'GFLOP/s':>10}{'act MiB':>9}  output",
+        ]
+        for row in rows:
+            shape = "x".join(map(str, row["shape"])) if row["shape"] else ""
+            lines.append(
+                f"{row['name']:<14}{row['calls']:>6}{row['mean_ms']:>10.2f}{row['percent']:>7.1f}"
+                f"{row['flops'] / 1e9:>9.2f}{row['gflops_per_s']:>10.1f}"
+                f"{row['activation_bytes'] / 2**20:>9.2f}  {shape}"
+            )
+        total_flops = sum(row["flops"] for row in rows)
+        forward_ms = sum(end - start for start, end in self.forwards) * 1000 / max(len(self.forwards), 1)
+        lines.append(f"{'total':<14}{'':>6}{forward_ms:>10.2f}{100:>7.1f}{total_flops / 1e9:>9.2f}")
+        return "\n".join(lines)
+
+    def chrome_trace(self, path=None):
+        """Trace Event Format dict (chrome://tracing, Perfetto); written to path if given."""
+        origin = min([start for start, _ in self.forwards] + [r["start"] for r in self.records], default=0.0)
+        events = [
+            {"name": f"{self.name}.forward", "ph": "X", "pid": 0, "tid": self.name,
+             "ts": (start - origin) * 1e6, "dur": (end - start) * 1e6}
+            for start, end in self.forwards
+        ]
+        events += [
+            {
+                "name": r["name"], "ph": "X", "pid": 0, "tid": self.name,
+                "ts": (r["start"] - origin) * 1e6, "dur": (r["end"] - r["start"]) * 1e6,
+                "args": {"flops": r["flops"], "activation_bytes": r["activation_bytes"], "shape": r["shape"]},
+            }
+            for r in self.records
+        ]
+        trace = {"traceEvents": events, "displayTimeUnit": "ms"}
+        if path is not None:
+            with open(path, "w") as f:
+                json.dump(trace, f)
+        return trace
+
+
+def profile_pair(gen, disc, batch_size=1, repeat=3, size=256):
+    """Profile repeat passes of gen and disc on random input, after one warmup pass."""
+    device = next(gen.parameters()).device
+    x = torch.randn(batch_size, 3, size, size, device=device)
+
+    with torch.no_grad():
+        fake = gen(x)
+        disc(x, fake)
+
+        with LayerProfiler(gen, "Generator") as gen_prof:
+            for _ in range(repeat):
+                fake = gen(x)
+        with LayerProfiler(disc, "Discriminator") as disc_prof:
+            for _ in range(repeat):
+                disc(x, fake)
+
+    return gen_prof, disc_prof
+
+
+def main():
+    from checkpoints import load_model
+    from deepGenerator import Generator
+    from discriminator import Discriminator
+
+    parser = argparse.ArgumentParser(description="Per-block time / FLOPs / activation memory of both models.")
+    parser.add_argument("--gen", help="generator checkpoint (random weights if omitted)")
+    parser.add_argument("--disc", help="discriminator checkpoint (random weights if omitted)")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--trace", help="write <prefix>_gen.json / <prefix>_disc.json Chrome traces")
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    gen = load_model(Generator, args.gen, device) if args.gen else Generator().to(device)
+    disc_factory = lambda: Discriminator(in_channels=3)
+    disc = load_model(disc_factory, args.disc, device) if args.disc else disc_factory().to(device)
+    gen.eval()
+    disc.eval()
+
+    gen_prof, disc_prof = profile_pair(gen, disc, args.batch_size, args.repeat)
+    print(gen_prof.table())
+    print()
+    print(disc_prof.table())
+
+    if args.trace:
+        gen_prof.chrome_trace(f"{args.trace}_gen.json")
+        disc_prof.chrome_trace(f"{args.trace}_disc.json")
+        print(f"\n=> Wrote {args.trace}_gen.json and {args.trace}_disc.json")
+
+
+if __name__ == "__main__":
+    main()
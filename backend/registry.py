@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import torch
+
+
+def _memory_in_use():
+    """Bytes currently allocated on the GPU, or resident for this process on CPU (None if unknown)."""
+    if torch.cuda.is_available():
+        return torch.cuda.memory_allocated()
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def _tensor_bytes(models):
+    total = 0
+    for model in models:
+        if hasattr(model, "state_dict"):
+            total += sum(
+                t.numel() * t.element_size()
+                for t in model.state_dict().values()
+                if isinstance(t, torch.Tensor)
+            )
+    return total
+
+
+class ModelRegistry:
+    """
+    Lazily loaded (generator, discriminator) pairs, one per model_type.
+
+    A pair is loaded by loader(model_type) the first time it is requested
+    (or up front through preload) and kept until it is evicted: least
+    recently used pairs are dropped while the loaded pairs exceed
+    memory_budget_mb, and pairs unused for idle_seconds are dropped on the
+    next access. A pair that is still running finishes with its own
+    reference; it is only freed afterwards.
+
+    identify(model_type), if given, names the weights a load reads (e.g.
+    cache.checkpoint_id of the files); it is computed once per load and
+    returned by model_id() until the next one.
+    """
+    def __init__(self, loader, memory_budget_mb=None, idle_seconds=None, identify=None):
+        self.loader = loader
+        self.identify = identify
+        self.memory_budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+        self.idle_seconds = idle_seconds
+
+        self._pairs = OrderedDict()  # model_type -> (models, resident_bytes)
+        self._last_used = {}
+        self._stats = {}
+        self._ids = {}
+        self._lock = threading.Lock()
+        # Loads are serialized so the memory measured around each one is its own
+        self._load_lock = threading.Lock()
+
+    def get(self, model_type):
+        """Return the (gen, disc) pair for model_type, loading it if needed."""
+        with self._lock:
+            self._evict_idle()
+            if model_type in self._pairs:
+                self._touch(model_type)
+                return self._pairs[model_type][0]
+
+        with self._load_lock:
+            with self._lock:
+                if model_type in self._pairs:
+                    self._touch(model_type)
+                    return self._pairs[model_type][0]
+
+            # Identified before reading, so a file replaced during the load
+            # is picked up by the next one
+            loaded_id = self.identify(model_type) if self.identify else None
+
+            before = _memory_in_use()
+            start = time.perf_counter()
+            models = self.loader(model_type)
+            load_seconds = time.perf_counter() - start
+            after = _memory_in_use()
+
+            # Memory-mapped weights (safetensors) are only faulted in on first
+            # use, so never count less than the size of the tensors themselves
+            resident = _tensor_bytes(models)
+            if before is not None and after is not None:
+                resident = max(resident, after - before)
+
+            with self._lock:
+                self._pairs[model_type] = (models, resident)
+                self._ids[model_type] = loaded_id
+                self._touch(model_type)
+                stats = self._stats.setdefault(model_type, {"loads": 0})
+                stats["loads"] += 1
+                stats["load_seconds"] = load_seconds
+                stats["resident_bytes"] = resident
+                self._evict_over_budget(keep=model_type)
+
+        print(f"Loaded {model_type} models in {load_seconds:.2f}s ({resident / 2**20:.1f} MiB)")
+        return models
+
+    def preload(self, model_types):
+        """Warmup hook: load the given model types ahead of traffic."""
+        for model_type in model_types:
+            self.get(model_type)
+
+    def model_id(self, model_type):
+        """identify(model_type) as of the last load (or first call, before any load)."""
+        with self._lock:
+            if model_type in self._ids:
+                return self._ids[model_type]
+        loaded_id = self.identify(model_type) if self.identify else None
+        with self._lock:
+            return self._ids.setdefault(model_type, loaded_id)
+
+    def evict(self, model_type):
+        with self._lock:
+            self._drop(model_type)
+
+    def info(self):
+        """Load time, resident size and idle time of every model type seen so far."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                model_type: {
+                    **stats,
+                    "loaded": model_type in self._pairs,
+                    "idle_seconds": now - self._last_used[model_type] if model_type in self._pairs else None,
+                }
+                for model_type, stats in self._stats.items()
+            }
+
+    def resident_bytes(self):
+        with self._lock:
+            return sum(resident for _, resident in self._pairs.values())
+
+    def _touch(self, model_type):
+        self._pairs.move_to_end(model_type)
+        self._last_used[model_type] = time.monotonic()
+
+    def _drop(self, model_type):
+        if self._pairs.pop(model_type, None) is not None:
+            self._last_used.pop(model_type, None)
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            print(f"Evicted {model_type} models")
+
+    def _evict_idle(self):
+        if not self.idle_seconds:
+            return
+        now = time.monotonic()
+        for model_type in list(self._pairs):
+            if now - self._last_used[model_type] > self.idle_seconds:
+                self._drop(model_type)
+
+    def _evict_over_budget(self, keep):
+        if not self.memory_budget:
+            return
+        for model_type in list(self._pairs):
+            if sum(resident for _, resident in self._pairs.values()) <= self.memory_budget:
+                break
+            if model_type != keep:
+                self._drop(model_type)
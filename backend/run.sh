@@ -1 +1,3 @@
-uvicorn main:app --reload --host 0.0.0.0 --port 8000
\ No newline at end of file
+uvicorn main:app --reload --host 0.0.0.0 --port 8000
+# Production: one API process, inference spread over worker processes sharing the weights
+# SERVE_WORKERS=4 uvicorn main:app --host 0.0.0.0 --port 8000
@@ -0,0 +1,114 @@
+import os
+
+# -------------------------
+# Serving Configuration
+# -------------------------
+# Every value can be overridden through the environment (see .env.example).
+
+# (generator, discriminator) checkpoints per model_type: .pth / .pth.tar
+# training checkpoints or .safetensors files from convert_checkpoint.py
+CHECKPOINTS = {
+    "object": (
+        os.getenv("OBJECT_GEN_CHECKPOINT", "finalObjectGen.pth"),
+        os.getenv("OBJECT_DISC_CHECKPOINT", "finalObjectDisc.pth.tar"),
+    ),
+    "scene": (
+        os.getenv("SCENE_GEN_CHECKPOINT", "SceneGen.pth.tar"),
+        os.getenv("SCENE_DISC_CHECKPOINT", "SceneDisc.pth.tar"),
+    ),
+}
+
+# Best-of-N candidates generated per request
+NUM_SAMPLES = int(os.getenv("NUM_SAMPLES", 5))
+
+# Adaptive sampling: stop drawing candidates once the best discriminator
+# score reaches SCORE_THRESHOLD, or once a new candidate improves it by less
+# than MIN_SCORE_GAIN (unset = always NUM_SAMPLES, which is then the cap).
+# Train/bench_adaptive.py suggests a threshold from validation data.
+SCORE_THRESHOLD = float(os.environ["SCORE_THRESHOLD"]) if os.getenv("SCORE_THRESHOLD") else None
+MIN_SCORE_GAIN = float(os.environ["MIN_SCORE_GAIN"]) if os.getenv("MIN_SCORE_GAIN") else None
+
+# Tiled high-resolution mode (/generate/tiled): overlapping 256x256 tiles,
+# TILE_BATCH_SIZE per forward pass, TILE_SAMPLES best-of-N per tile. Inputs
+# are downscaled to TILE_MAX_SIDE on their longest side (0 = never).
+# TILE_OVERLAP must be smaller than the 256 pixel tile.
+TILE_OVERLAP = int(os.getenv("TILE_OVERLAP", 64))
+TILE_BATCH_SIZE = int(os.getenv("TILE_BATCH_SIZE", 8))
+TILE_SAMPLES = int(os.getenv("TILE_SAMPLES", 1))
+TILE_MAX_SIDE = int(os.getenv("TILE_MAX_SIDE", 4096)) or None
+if not 0 <= TILE_OVERLAP < 256:
+    raise ValueError(f"TILE_OVERLAP must be in [0, 256), got {TILE_OVERLAP}")
+
+# Response encoding. OUTPUT_FORMAT (png | webp | jpeg) is used unless the
+# client asks for another through ?format= or its Accept header.
+# PNG_COMPRESSION is the zlib level (0-9, lower = faster, larger).
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "png")
+if OUTPUT_FORMAT not in ("png", "webp", "jpeg"):
+    raise ValueError(f"OUTPUT_FORMAT must be png, webp or jpeg, got {OUTPUT_FORMAT!r}")
+PNG_COMPRESSION = int(os.getenv("PNG_COMPRESSION", 1))
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", 90))
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", 90))
+
+# Micro-batching: concurrent requests for the same model_type are grouped
+# into one forward pass of up to MAX_BATCH_SIZE requests, waiting at most
+# MAX_WAIT_MS for the batch to fill. MAX_BATCH_SIZE=1 disables grouping.
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 4))
+MAX_WAIT_MS = float(os.getenv("MAX_WAIT_MS", 10))
+
+# Result cache: LRU over generated images, bounded by entry count and size.
+# CACHE_DIR enables an on-disk tier that survives restarts, bounded by
+# CACHE_DISK_MAX_MB (least recently used files are deleted first).
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 256))
+CACHE_MAX_MB = float(os.getenv("CACHE_MAX_MB", 64))
+CACHE_DIR = os.getenv("CACHE_DIR") or None
+CACHE_DISK_MAX_MB = float(os.getenv("CACHE_DISK_MAX_MB") or 1024)
+
+# Default sampling seed for requests without ?seed=. Unset = derived from
+# the upload, so every result is reproducible either way: candidate k of a
+# request is drawn with seed + k, and the seed of the chosen one comes back
+# in the X-Seed header.
+SEED = int(os.environ["SEED"]) if os.getenv("SEED") else None
+
+# Deterministic mode: deterministic kernels and one Generator pass per
+# candidate, so re-rendering an X-Seed with num_samples=1 is bit-identical
+# (otherwise equal up to floating-point noise). Slower.
+DETERMINISTIC = os.getenv("DETERMINISTIC", "0") == "1"
+
+# Inference engine: "eager" (plain PyTorch), "script" (TorchScript),
+# "compile" (torch.compile) or "onnx" (ONNX Runtime, CPU only). The
+# compiled engines fold BatchNorm into the preceding conv and are checked
+# against eager mode at startup. "onnx" needs onnxruntime and the models
+# exported with export_onnx.py.
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "eager")
+if INFERENCE_ENGINE not in ("eager", "script", "compile", "onnx"):
+    raise ValueError(f"INFERENCE_ENGINE must be eager, script, compile or onnx, got {INFERENCE_ENGINE!r}")
+
+# ONNX Runtime intra-op threads (0 = one per physical core)
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", 0))
+
+# Keep the Generator's dropout active at inference (MC-dropout sampling)
+STOCHASTIC_DROPOUT = os.getenv("STOCHASTIC_DROPOUT", "0") == "1"
+
+# Model types served by the int8 models from Train/quantize.py
+# (comma-separated, e.g. "object,scene"). CPU only; overrides INFERENCE_ENGINE.
+QUANTIZED_MODELS = {t for t in os.getenv("QUANTIZED_MODELS", "").split(",") if t}
+
+# Model pairs are loaded lazily on first request. PRELOAD_MODELS lists the
+# model types loaded at startup instead (e.g. "object,scene"). Least
+# recently used pairs are evicted while the loaded pairs exceed
+# MODEL_MEMORY_BUDGET_MB, and pairs idle for MODEL_IDLE_SECONDS are
+# unloaded (unset = no limit).
+PRELOAD_MODELS = [t for t in os.getenv("PRELOAD_MODELS", "").split(",") if t]
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB") or 0) or None
+MODEL_IDLE_SECONDS = float(os.getenv("MODEL_IDLE_SECONDS") or 0) or None
+
+# Production serving: run inference in SERVE_WORKERS processes that share
+# one copy of the weights (0 = in-process). Eager models on CPU only; every
+# model type is loaded at startup and kept. THREADS_PER_WORKER defaults to
+# the CPU count divided by the number of workers.
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", 0))
+THREADS_PER_WORKER = int(os.getenv("THREADS_PER_WORKER") or 0) or None
+
+# Expose GET /profile (per-block time / FLOPs / activation memory of the
+# served models, see profiling.py). Eager models only; off in production.
+PROFILING = os.getenv("PROFILING", "0") == "1"
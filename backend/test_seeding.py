@@ -0,0 +1,162 @@
+"""
+Seeded generation end to end: /generate and /generate/stream must render
+the same image for the same seed with stochastic dropout on, also while
+other requests run on the same model at the same time.
+
+Small random-weight models stand in for the checkpoints, so it runs
+anywhere (an untrained Generator's output barely depends on its dropout):
+    python -m pytest test_seeding.py
+"""
+import asyncio
+import base64
+import io
+import json
+import os
+import time
+
+# Read by settings when main is imported
+os.environ["STOCHASTIC_DROPOUT"] = "1"
+os.environ["SERVE_WORKERS"] = "0"
+os.environ["CACHE_MAX_ENTRIES"] = "0"  # every request generates
+os.environ.pop("SEED", None)
+os.environ.pop("CACHE_DIR", None)
+
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+import torch  # noqa: E402
+import torch.nn as nn  # noqa: E402
+from PIL import Image  # noqa: E402
+import main  # noqa: E402
+import settings  # noqa: E402
+from apiUtils import install_seeded_dropout  # noqa: E402
+from batcher import MicroBatcher  # noqa: E402
+from discriminator import Discriminator  # noqa: E402
+from engine import set_dropout  # noqa: E402
+from registry import ModelRegistry  # noqa: E402
+
+
+class DropoutGenerator(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = nn.Conv2d(3, 3, 3, padding=1)
+        self.dropout = nn.Dropout(0.5)
+
+    def forward(self, x):
+        x = self.conv(x)
+        time.sleep(0.02)  # so that concurrent requests overlap inside the model
+        return torch.tanh(self.dropout(x))
+
+
+def random_models(model_type):
+    torch.manual_seed(0)
+    gen = install_seeded_dropout(set_dropout(DropoutGenerator().eval(), True))
+    disc = Discriminator(in_channels=3).eval()
+    return gen, disc
+
+
+main.registry = ModelRegistry(random_models, identify=lambda model_type: "random")
+
+
+def sketch_png(seed=0):
+    rng = np.random.default_rng(seed)
+    buf = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (300, 200, 3), dtype=np.uint8)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def decode(content):
+    return np.array(Image.open(io.BytesIO(content)).convert("RGB")).astype(int)
+
+
+async def _generate(client, image, seed, num_samples=1):
+    """The /generate image and the seed of the candidate it picked."""
+    r = await client.post(
+        "/generate",
+        params={"model_type": "object", "format": "png", "seed": seed, "num_samples": num_samples},
+        files={"file": ("sketch.png", image, "image/png")},
+    )
+    assert r.status_code == 200
+    return decode(r.content), int(r.headers["x-seed"])
+
+
+async def _stream(client, image, seed, num_samples=1):
+    """{seed: image} of the candidates /generate/stream sent."""
+    async with client.stream(
+        "POST",
+        "/generate/stream",
+        params={"model_type": "object", "seed": seed, "num_samples": num_samples},
+        files={"file": ("sketch.png", image, "image/png")},
+    ) as r:
+        assert r.status_code == 200
+        body = "".join([chunk async for chunk in r.aiter_text()])
+    lines = body.splitlines()
+    candidates = [
+        json.loads(data[len("data: "):])
+        for event, data in zip(lines, lines[1:])
+        if event == "event: candidate"
+    ]
+    return {c["seed"]: decode(base64.b64decode(c["image"].split(",", 1)[1])) for c in candidates}
+
+
+def _serve(requests):
+    """Run the coroutine function requests(client) against the app; returns its result."""
+    # The lifespan closes the batcher, so every run gets a new one
+    main.batcher = MicroBatcher(main.run_batch, max_batch_size=settings.MAX_BATCH_SIZE, max_wait_ms=settings.MAX_WAIT_MS)
+
+    async def run():
+        async with main.app.router.lifespan_context(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=300) as client:
+                return await requests(client)
+    return asyncio.run(run())
+
+
+def _same(a, b):
+    # Same dropout masks; batched and single passes may differ by rounding
+    return np.abs(a - b).max() <= 1
+
+
+def test_same_seed_same_image_on_both_endpoints():
+    image = sketch_png()
+
+    async def requests(client):
+        return {
+            seed: ((await _generate(client, image, seed))[0], (await _stream(client, image, seed))[seed])
+            for seed in (1234, 1235)
+        }
+    images = _serve(requests)
+
+    for generated, streamed in images.values():
+        assert _same(generated, streamed)
+
+    # And the seed does reach the dropout masks
+    assert not _same(images[1234][0], images[1235][0])
+
+
+def test_concurrent_requests_keep_their_seeds():
+    sketches = [sketch_png(i) for i in range(3)]
+
+    async def concurrent(client):
+        # Batched best-of-4 requests and streams, all on the same model at once
+        return await asyncio.gather(
+            *[_generate(client, sketch, 100 + 10 * i, num_samples=4) for i, sketch in enumerate(sketches)],
+            *[_stream(client, sketch, 500 + 10 * i, num_samples=3) for i, sketch in enumerate(sketches)],
+        )
+    results = _serve(concurrent)
+    generated, streamed = results[: len(sketches)], results[len(sketches):]
+
+    async def one_at_a_time(client):
+        # Every candidate on its own: the reference for what its seed renders
+        rendered = [await _generate(client, sketch, seed) for sketch, (_, seed) in zip(sketches, generated)]
+        for sketch, candidates in zip(sketches, streamed):
+            for seed in candidates:
+                rendered.append(await _generate(client, sketch, seed))
+        return rendered
+    reference = iter(image for image, _ in _serve(one_at_a_time))
+
+    for image, _ in generated:
+        assert _same(image, next(reference))
+    for candidates in streamed:
+        assert len(candidates) == 3
+        for image in candidates.values():
+            assert _same(image, next(reference))
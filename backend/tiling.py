@@ -0,0 +1,156 @@
+"""
+Tiled inference for inputs larger than 256x256.
+
+The Generator's bottleneck reduces a 256x256 input to 1x1, so it only runs
+on 256x256 tiles. A large image is covered with overlapping tiles that are
+generated a batch at a time and blended with a linear ramp over the
+overlap, so there are no seams. Tiles are processed one row at a time and
+every finished band of output rows is yielded straight away, so the output
+side only ever holds a tile-high float strip. The input itself is a whole
+(1, 3, H, W) float tensor, 12 bytes per pixel: its size is bounded by
+TILE_MAX_SIDE, not by the tiling.
+
+Run directly to benchmark megapixels per second:
+    python tiling.py --sizes 512 1024 2048 --gen finalObjectGen.pth
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+import torch
+from apiUtils import best_of_n, decode_image, norm, tensor_to_array
+from checkpoints import load_model
+from deepGenerator import Generator
+from discriminator import Discriminator
+from metrics import peak_rss_mb
+
+TILE = 256
+
+
+def preprocess_tiled(image_bytes, max_side=None):
+    """
+    Decode an upload at full resolution (longest side capped at max_side)
+    and return the normalized (1, 3, H, W) input tensor.
+    """
+    img = cv2.cvtColor(decode_image(image_bytes), cv2.COLOR_BGR2RGB)
+    h, w = img.shape[:2]
+    if max_side and max(h, w) > max_side:
+        scale = max_side / max(h, w)
+        img = cv2.resize(img, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+
+    x = torch.from_numpy(np.ascontiguousarray(img)).permute(2, 0, 1).float().div_(255)
+    return norm(x).unsqueeze(0)
+
+
+def tile_starts(length, tile, stride):
+    """Tile offsets covering [0, length), the last one flush with the end."""
+    starts = list(range(0, max(length - tile, 0), stride))
+    return starts + [max(length - tile, 0)]
+
+
+def blend_window(tile, overlap, device):
+    """(1, tile, tile) weights ramping up linearly over the overlap from each edge."""
+    ramp = torch.ones(tile, device=device)
+    if overlap > 0:
+        i = torch.arange(tile, device=device, dtype=torch.float32)
+        ramp = torch.minimum((i + 0.5) / overlap, (tile - i - 0.5) / overlap).clamp(max=1)
+    return (ramp[:, None] * ramp[None, :]).unsqueeze(0)
+
+
+def iter_tiled_bands(input_tensor, gen, disc=None, overlap=64, batch_size=8, num_samples=1):
+    """
+    Generate a (1, 3, H, W) input tile by tile and yield (y, band) pairs,
+    where band is the finished (3, rows, W) output starting at row y.
+
+    Tiles of a row are run batch_size at a time. num_samples > 1 picks the
+    best of N per tile with disc.
+    """
+    if not 0 <= overlap < TILE:
+        raise ValueError(f"Tile overlap must be in [0, {TILE}), got {overlap}")
+
+    _, _, h, w = input_tensor.shape
+    # Inputs smaller than a tile are padded up to one and cropped back
+    pad_h, pad_w = max(TILE - h, 0), max(TILE - w, 0)
+    if pad_h or pad_w:
+        input_tensor = torch.nn.functional.pad(input_tensor, (0, pad_w, 0, pad_h), mode="replicate")
+    H, W = h + pad_h, w + pad_w
+
+    stride = TILE - overlap
+    ys, xs = tile_starts(H, TILE, stride), tile_starts(W, TILE, stride)
+    window = blend_window(TILE, overlap, input_tensor.device)
+
+    # Rolling strip of the rows [top, top + TILE) still receiving tiles
+    acc = torch.zeros(3, TILE, W, device=input_tensor.device)
+    weight = torch.zeros(1, TILE, W, device=input_tensor.device)
+    top = 0
+
+    with torch.no_grad():
+        for y in ys:
+            if y > top:
+                # Rows above this tile row are final
+                shift = y - top
+                yield top, (acc[:, :shift] / weight[:, :shift])[:, :, :w]
+                acc = torch.cat([acc[:, shift:], acc.new_zeros(3, shift, W)], dim=1)
+                weight = torch.cat([weight[:, shift:], weight.new_zeros(1, shift, W)], dim=1)
+                top = y
+
+            for i in range(0, len(xs), batch_size):
+                batch_xs = xs[i : i + batch_size]
+                tiles = torch.cat([input_tensor[:, :, y : y + TILE, x : x + TILE] for x in batch_xs])
+                if num_samples > 1:
+                    fakes = best_of_n(tiles, gen, disc, num_samples)
+                else:
+                    fakes = gen(tiles)
+                for x, fake in zip(batch_xs, fakes):
+                    acc[:, :, x : x + TILE] += fake * window
+                    weight[:, :, x : x + TILE] += window
+
+        yield top, (acc / weight)[:, : h - top, :w]
+
+
+def tiled_generate(input_tensor, gen, disc=None, overlap=64, batch_size=8, num_samples=1):
+    """Run tiled inference on a (1, 3, H, W) input; returns an RGB uint8 (H, W, 3) array."""
+    _, _, h, w = input_tensor.shape
+    output = np.empty((h, w, 3), dtype=np.uint8)
+    for y, band in iter_tiled_bands(input_tensor, gen, disc, overlap, batch_size, num_samples):
+        output[y : y + band.shape[1]] = tensor_to_array(band)
+    return output
+
+
+# -------------------------
+# Benchmark
+# -------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tiled inference throughput.")
+    parser.add_argument("--gen", help="generator checkpoint (random weights if omitted)")
+    parser.add_argument("--disc", help="discriminator checkpoint, for --num-samples > 1")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 1024, 2048])
+    parser.add_argument("--overlap", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--num-samples", type=int, default=1)
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    gen = load_model(Generator, args.gen, device) if args.gen else Generator().to(device)
+    disc = None
+    if args.num_samples > 1:
+        factory = lambda: Discriminator(in_channels=3)
+        disc = load_model(factory, args.disc, device) if args.disc else factory().to(device)
+        disc.eval()
+    gen.eval()
+
+    for size in args.sizes:
+        x = torch.rand(1, 3, size, size, device=device) * 2 - 1
+        start = time.perf_counter()
+        tiled_generate(x, gen, disc, args.overlap, args.batch_size, args.num_samples)
+        seconds = time.perf_counter() - start
+        tiles = len(tile_starts(size, TILE, TILE - args.overlap)) ** 2
+        peak = peak_rss_mb()
+        print(
+            f"{size}x{size}: {tiles} tiles in {seconds:.2f}s | {size * size / 1e6 / seconds:.3f} MP/s | "
+            f"peak RSS {f'{peak:.0f} MiB' if peak is not None else 'n/a'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import itertools
+import os
+import queue
+import threading
+from concurrent.futures import Future
+import torch
+import torch.multiprocessing as mp
+from apiUtils import generate_batch
+
+
+def _worker_main(models, tasks, results, threshold, min_gain, deterministic, num_threads):
+    """Inference process: take the next batch off the shared queue, return its outputs."""
+    torch.set_num_threads(num_threads)
+    if deterministic:
+        torch.use_deterministic_algorithms(True, warn_only=True)
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+
+        task_id, model_type, num_samples, inputs, seeds = task
+        try:
+            gen, disc = models[model_type]
+            outputs = generate_batch(inputs, gen, disc, num_samples, seeds, threshold, min_gain, deterministic)
+            results.put((task_id, outputs, None))
+        except Exception as e:
+            results.put((task_id, None, f"{type(e).__name__}: {e}"))
+
+
+class WorkerPool:
+    """
+    N inference processes sharing a single copy of the weights.
+
+    Every model is moved into shared memory with share_memory() before the
+    workers are spawned. Torch's multiprocessing pickler then hands the
+    shared storages to each worker as file descriptors, so all processes
+    map the same pages instead of holding their own copy.
+
+    Batches go through one task queue, so whichever worker is idle picks up
+    the next one. run_batch blocks the calling thread until the result is
+    back and is meant to be called from several threads at once.
+    """
+    def __init__(self, models, num_workers, threads_per_worker=None, threshold=None, min_gain=None,
+                 deterministic=False):
+        for gen, disc in models.values():
+            gen.share_memory()
+            disc.share_memory()
+
+        threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+
+        ctx = mp.get_context("spawn")
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._processes = [
+            ctx.Process(
+                target=_worker_main,
+                args=(models, self._tasks, self._results, threshold, min_gain, deterministic, threads_per_worker),
+                daemon=True,
+            )
+            for _ in range(num_workers)
+        ]
+        for process in self._processes:
+            process.start()
+
+        self._ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+        print(f"Started {num_workers} inference workers ({threads_per_worker} threads each)")
+
+    def run_batch(self, model_type, num_samples, inputs, seeds=None):
+        future = Future()
+        with self._lock:
+            task_id = next(self._ids)
+            self._pending[task_id] = future
+        self._tasks.put((task_id, model_type, num_samples, inputs.cpu(), seeds))
+
+        while True:
+            try:
+                return future.result(timeout=1.0)
+            except TimeoutError:
+                dead = [p.pid for p in self._processes if not p.is_alive()]
+                if dead:
+                    with self._lock:
+                        self._pending.pop(task_id, None)
+                    raise RuntimeError(f"Inference worker(s) {dead} exited unexpectedly")
+
+    def close(self):
+        self._closed = True
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+    def _collect(self):
+        while not self._closed:
+            try:
+                task_id, outputs, error = self._results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+
+            with self._lock:
+                future = self._pending.pop(task_id, None)
+            if future is None:
+                continue
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                # Copy out of the shared-memory segment the worker sent it in
+                best, used, chosen = outputs
+                future.set_result((best.clone(), used.clone(), chosen))